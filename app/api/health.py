@@ -0,0 +1,37 @@
+import os
+import logging
+
+from app.api.jobs import job_queue
+from app.api.sheet_writes import sheet_writer
+from app.utils.providers import get_provider
+from app.utils.governor import google_governor
+from app.utils.google_sheets import credentials_available
+from app.config import GOOGLE_API_KEY, ROUTING_PROVIDER, GEOCODING_PROVIDER, LOCAL_GRAPH_PATH, OUTPUT_SINK
+
+logger = logging.getLogger("app.health")
+
+
+def readiness_checks():
+    """
+    Local readiness checks. Nothing here contacts Google or opens the
+    spreadsheet; open circuits are reported but do not fail readiness.
+    The API key and Sheets credentials are only required when the configured
+    routing, geocoding or output sink uses them.
+    """
+    checks = {
+        "job_workers": job_queue.running(),
+        "sheet_writer": sheet_writer.running()
+    }
+    if ROUTING_PROVIDER == "google" or GEOCODING_PROVIDER == "google":
+        checks["google_api_key"] = GOOGLE_API_KEY != "YOUR_DEFAULT_API_KEY"
+    if OUTPUT_SINK == "sheets":
+        checks["sheets_credentials"] = credentials_available()
+    try:
+        get_provider(ROUTING_PROVIDER)
+        checks["routing_provider"] = ROUTING_PROVIDER != "local" or not LOCAL_GRAPH_PATH or os.path.isfile(LOCAL_GRAPH_PATH)
+    except Exception as e:
+        logger.error(f"Routing provider not ready: {str(e)}")
+        checks["routing_provider"] = False
+
+    open_circuits = [endpoint for endpoint, stats in google_governor.stats().items() if stats["state"] == "open"]
+    return all(checks.values()), {"checks": checks, "open_circuits": open_circuits}
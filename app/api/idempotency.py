@@ -0,0 +1,105 @@
+import json
+import hashlib
+import logging
+
+from app.models import MultiPitRequest
+from app.utils.cache import TTLCache, make_store
+from app.utils.singleflight import SingleFlight
+from app.config import (
+    IDEMPOTENCY_CACHE_PATH,
+    IDEMPOTENCY_TTL_SECONDS,
+    IDEMPOTENCY_CACHE_MAX_ENTRIES,
+    SHARED_LOCK_DIR
+)
+
+logger = logging.getLogger("app.idempotency")
+
+# Completed multi-pit runs ({"pit_results", "sheets"}) keyed by request fingerprint
+result_cache = TTLCache(
+    "idempotency",
+    maxsize=IDEMPOTENCY_CACHE_MAX_ENTRIES,
+    ttl=IDEMPOTENCY_TTL_SECONDS,
+    store=make_store(
+        "idempotency",
+        IDEMPOTENCY_CACHE_PATH,
+        max_entries=IDEMPOTENCY_CACHE_MAX_ENTRIES
+    )
+)
+
+# Whole runs hold their lock for minutes, so waiters get a long timeout and
+# more stripes keep unrelated requests from queueing behind each other
+run_flight = SingleFlight(
+    "multi_pit_route", lock_dir=SHARED_LOCK_DIR, lookup=result_cache.get, publish=result_cache.publish,
+    lock_timeout=600, stripes=4096
+)
+
+
+def request_fingerprint(data: MultiPitRequest, idempotency_key=None):
+    """
+    Canonical SHA-256 of the request body, salted with the client's
+    Idempotency-Key header when one is sent.
+    """
+    body = json.dumps(data.model_dump(), sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(body.encode())
+    if idempotency_key:
+        digest.update(b"\0" + idempotency_key.encode())
+    return digest.hexdigest()
+
+
+class _FlightProgress:
+    """
+    Progress listeners for one in-flight run, with the reports so far so
+    that callers joining late catch up.
+    """
+
+    def __init__(self):
+        self.callers = 0
+        self.listeners = []
+        self.reports = []
+
+    def report(self, stage, status, **info):
+        self.reports.append((stage, status, info))
+        for listener in list(self.listeners):
+            listener(stage, status, **info)
+
+    def attach(self, listener):
+        for stage, status, info in self.reports:
+            listener(stage, status, **info)
+        self.listeners.append(listener)
+
+
+# Progress fan-out for runs in flight in this process, keyed by fingerprint
+_flight_progress = {}
+
+
+async def run_once(fingerprint, func, *args, progress=None, **kwargs):
+    """
+    Return the cached result for fingerprint, or run `await func(...)` once
+    (concurrent duplicates attach to the running call) and cache it.
+    func is called with a progress callback that reaches every caller's
+    progress(stage, status, **info), including callers that attached to
+    the run. Returns (result, replayed). Failures are not cached.
+    """
+    cached = result_cache.get(fingerprint)
+    if cached is not None:
+        logger.info(f"Replaying stored result for request {fingerprint[:12]}")
+        return cached, True
+
+    flight = _flight_progress.setdefault(fingerprint, _FlightProgress())
+    flight.callers += 1
+    if progress is not None:
+        flight.attach(progress)
+
+    async def run():
+        result = await func(*args, progress=flight.report, **kwargs)
+        result_cache.set(fingerprint, result)
+        return result
+
+    try:
+        return await run_flight.do_async(fingerprint, run), False
+    finally:
+        flight.callers -= 1
+        if progress is not None:
+            flight.listeners.remove(progress)
+        if not flight.callers and _flight_progress.get(fingerprint) is flight:
+            del _flight_progress[fingerprint]
@@ -0,0 +1,371 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+
+from fastapi import HTTPException
+
+from app.models import MultiPitRequest
+from app.api.routes import run_multi_pit_route, pit_result_json
+from app.api.idempotency import request_fingerprint, run_once
+from app.utils.cache import atomic_write_text
+from app.utils.metrics import REGISTRY, Gauge
+from app.utils.tracing import span
+from app.utils.locks import ProcessLock
+from app.config import JOBS_DIR, JOB_WORKERS, JOB_QUEUE_MAX, JOB_RETENTION_SECONDS, IDEMPOTENCY_TTL_SECONDS
+
+logger = logging.getLogger("app.jobs")
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while the queue is at JOB_QUEUE_MAX.
+    """
+
+
+class JobStore:
+    """
+    Job records kept in memory and persisted one JSON file per job, so
+    queued and running jobs survive a restart. New jobs are written before
+    they are accepted; later updates are written by a background thread
+    that keeps only the latest version of each job. With several server
+    processes sharing the directory, jobs this process is not running are
+    read from disk so any worker can answer a poll. Finished jobs leave
+    memory once they are past the idempotency window.
+    """
+
+    _EVICT_EVERY_SECONDS = 60
+
+    def __init__(self, directory=JOBS_DIR):
+        self.directory = directory
+        self._jobs = {}
+        self._active = set()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._writing = 0
+        self._writer = None
+        self._written = threading.Condition()
+        self._evicted_at = time.monotonic()
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def lock(self, job_id):
+        return ProcessLock(os.path.join(self.directory, f"{job_id}.lock"))
+
+    def read(self, job_id):
+        """
+        Read a job record from disk, or None if it does not exist.
+        """
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read job file {self._path(job_id)}: {e}")
+            return None
+
+    def load(self):
+        """
+        Load persisted jobs, dropping expired ones. Returns the jobs that
+        were queued or running and must be resumed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        resume = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or name.startswith("."):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read job file {path}: {e}")
+                continue
+            if job["status"] in ("succeeded", "failed") and now - job["updated_at"] > JOB_RETENTION_SECONDS:
+                for expired in (path, path[:-len(".json")] + ".lock"):
+                    try:
+                        os.unlink(expired)
+                    except FileNotFoundError:
+                        pass
+                continue
+            with self._lock:
+                self._jobs[job["id"]] = job
+            if job["status"] in ("queued", "running"):
+                resume.append(job)
+        return sorted(resume, key=lambda job: job["created_at"])
+
+    def create(self, request, fingerprint=None):
+        """
+        Register a new queued job in memory, where find() already sees it.
+        It is not accepted until write() has put it on disk.
+        """
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "created_at": now,
+            "updated_at": now,
+            "fingerprint": fingerprint,
+            "request": request,
+            "stages": {},
+            "pit_results": None,
+            "sheets": None,
+            "trace_id": None,
+            "error": None
+        }
+        self.claim(job["id"])
+        with self._lock:
+            self._jobs[job["id"]] = job
+        return job
+
+    def write(self, job):
+        """
+        Persist a job before returning. Blocks on disk, so run it off the
+        event loop.
+        """
+        with self._lock:
+            body = json.dumps(job)
+        atomic_write_text(self._path(job["id"]), body)
+
+    def discard(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._active.discard(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and (job["status"] in ("succeeded", "failed") or job_id in self._active):
+                return job
+        # Unknown here or being run by another process: the file is authoritative
+        return self.read(job_id) or job
+
+    def claim(self, job_id):
+        with self._lock:
+            self._active.add(job_id)
+
+    def release(self, job_id):
+        with self._lock:
+            self._active.discard(job_id)
+
+    def find(self, fingerprint):
+        """
+        Return the newest job for a request fingerprint that is still queued
+        or running, or that succeeded within the idempotency window.
+        """
+        cutoff = time.time() - IDEMPOTENCY_TTL_SECONDS
+        with self._lock:
+            matches = [
+                job for job in self._jobs.values()
+                if job.get("fingerprint") == fingerprint and (
+                    job["status"] in ("queued", "running")
+                    or (job["status"] == "succeeded" and job["updated_at"] >= cutoff)
+                )
+            ]
+        return max(matches, key=lambda job: job["created_at"], default=None)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+        self.save(job)
+        return job
+
+    def save(self, job):
+        """
+        Record a job and persist it in the background.
+        """
+        job["updated_at"] = time.time()
+        with self._lock:
+            self._jobs[job["id"]] = job
+            body = json.dumps(job)
+        with self._written:
+            self._pending[job["id"]] = body
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_pending, name="job-writer", daemon=True)
+                self._writer.start()
+            self._written.notify_all()
+        if time.monotonic() - self._evicted_at >= self._EVICT_EVERY_SECONDS:
+            self._evict()
+
+    def _write_pending(self):
+        while True:
+            with self._written:
+                while not self._pending:
+                    self._written.wait()
+                job_id, body = self._pending.popitem()
+                self._writing += 1
+            try:
+                atomic_write_text(self._path(job_id), body)
+            except OSError as e:
+                logger.error(f"Could not write job file {self._path(job_id)}: {e}")
+            finally:
+                with self._written:
+                    self._writing -= 1
+                    self._written.notify_all()
+
+    def flush(self, timeout=30):
+        """
+        Wait until every pending job update is on disk.
+        """
+        with self._written:
+            return self._written.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def _evict(self):
+        cutoff = time.time() - IDEMPOTENCY_TTL_SECONDS
+        with self._lock:
+            self._evicted_at = time.monotonic()
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in ("succeeded", "failed") and job["updated_at"] < cutoff and job_id not in self._active
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if expired:
+            logger.debug(f"Evicted {len(expired)} finished jobs from memory")
+
+
+class JobQueue:
+    """
+    Bounded queue of multi-pit route jobs drained by a pool of asyncio workers.
+    """
+
+    def __init__(self, store, workers=JOB_WORKERS, maxsize=JOB_QUEUE_MAX):
+        self.store = store
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        for job in self.store.load():
+            # Every process sees the same files; _run's per-job lock picks one runner
+            logger.info(f"Resuming job {job['id']} ({job['status']})")
+            self._queue.put_nowait(job["id"])
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self.store.flush)
+
+    async def submit(self, data: MultiPitRequest, idempotency_key=None):
+        """
+        Queue a job, or return the existing job for an identical request that
+        is still queued, running or recently succeeded.
+        """
+        fingerprint = request_fingerprint(data, idempotency_key)
+        existing = self.store.find(fingerprint)
+        if existing is not None:
+            logger.info(f"Request matches job {existing['id']} ({existing['status']})")
+            return existing
+        if self._queue.qsize() >= self.maxsize:
+            raise QueueFullError("Job queue is full, try again later")
+        job = self.store.create(data.model_dump(), fingerprint)
+        try:
+            await asyncio.to_thread(self.store.write, job)
+        except BaseException:
+            self.store.discard(job["id"])
+            raise
+        self._queue.put_nowait(job["id"])
+        return job
+
+    def running(self):
+        return bool(self._tasks) and not all(task.done() for task in self._tasks)
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self, n):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job worker {n} crashed on {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id):
+        lock = self.store.lock(job_id)
+        if not lock.try_acquire():
+            logger.info(f"Job {job_id} is being run by another process")
+            return
+        try:
+            job = self.store.read(job_id)
+            if job is None or job["status"] in ("succeeded", "failed"):
+                return
+            self.store.claim(job_id)
+            await self._execute(job)
+        finally:
+            self.store.release(job_id)
+            lock.release()
+
+    async def _execute(self, job):
+        job_id = job["id"]
+        job["status"] = "running"
+        self.store.save(job)
+        stages = job["stages"]
+
+        def progress(stage, status, **info):
+            stages[stage] = {"status": status, **info}
+            self.store.update(job_id, stages=stages)
+
+        data = MultiPitRequest(**job["request"])
+        fingerprint = job.get("fingerprint") or request_fingerprint(data)
+        try:
+            with span("job multi-pit-route", job_id=job_id) as root:
+                self.store.update(job_id, trace_id=root.trace_id)
+                result, _ = await run_once(fingerprint, run_multi_pit_route, data, progress=progress)
+                if not stages:
+                    # Replayed, or run by another process while this one waited
+                    progress("shared", "done", flight=fingerprint[:12])
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            self.store.update(job_id, status="failed", error=str(e))
+            return
+        self.store.update(job_id, status="succeeded", pit_results=result["pit_results"], sheets=result["sheets"])
+
+
+job_queue = JobQueue(JobStore())
+
+queue_depth = Gauge("job_queue_depth", "Multi-pit route jobs waiting for a worker.")
+
+
+@REGISTRY.register_collector
+def collect_job_queue():
+    queue_depth.set(job_queue.depth())
+
+
+async def submit_multi_pit_job(data: MultiPitRequest, idempotency_key=None):
+    """
+    Queue a multi-pit route job and return its id for polling.
+    """
+    try:
+        job = await job_queue.submit(data, idempotency_key)
+    except QueueFullError as e:
+        logger.error(f"Rejected job: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+def get_job_status(job_id: str):
+    """
+    Return a job's status, per-stage progress and, once finished, its results.
+    """
+    job = job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    status = {key: value for key, value in job.items() if key not in ("request", "fingerprint")}
+    if status["pit_results"] is not None:
+        status["pit_results"] = [pit_result_json(pit_result) for pit_result in status["pit_results"]]
+    return status
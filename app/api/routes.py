@@ -1,119 +1,538 @@
+import json
+import asyncio
 import logging
-import time
-from datetime import datetime, timedelta
 from fastapi import HTTPException
-from app.models import MultiPitRequest
-from app.utils.geo import get_coordinates, reverse_geocode
-from app.utils.routing import calculate_pit_routes
-from app.config import GOOGLE_API_KEY
-from app.utils.google_sheets import (
-    get_or_create_unique_worksheet,
-    write_locations_section,
-    write_distance_section,
-    write_schedule_section
+from fastapi.responses import StreamingResponse
+from app.models import MultiPitRequest, BatchMultiPitRequest
+from app.utils.geo import get_coordinates_async, reverse_geocode_async, get_leg_matrix_async
+from app.utils.routing import (
+    pit_leg_pairs,
+    plan_pit_schedule,
+    resolve_pit_legs_async,
+    resolve_legs_async,
+    prefetch_legs_async
 )
+from app.utils.governor import CircuitOpenError
+from app.api.idempotency import request_fingerprint, run_once
+from app.utils.providers import get_provider
+from app.utils.metrics import stage_seconds, pipelines_in_flight
+from app.utils.tracing import span
+from app.api.sheet_writes import sheet_writer
+from app.config import GOOGLE_API_KEY, USE_DISTANCE_MATRIX, BATCH_MAX_REQUESTS, BATCH_CONCURRENCY, SHEETS_WRITE_MODE
+from app.utils.sinks import get_sink
+from app.utils.google_sheets import locations_section, distance_section, schedule_section
+from app.utils.schedule import Schedule, schedule_table
 
 logger = logging.getLogger("app.api")
 
-async def get_multi_pit_route(data: MultiPitRequest):
+
+async def resolve_sites(urls, limit=None):
+    """
+    Resolve coordinates and an address for each distinct URL once, at most
+    `limit` lookups at a time. Returns {url: location dict or the exception
+    that stopped it}.
+    """
+    urls = list(dict.fromkeys(urls))
+    semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def bounded(coro):
+        if semaphore is None:
+            return await coro
+        async with semaphore:
+            return await coro
+
+    coords = await asyncio.gather(
+        *(bounded(get_coordinates_async(url, GOOGLE_API_KEY)) for url in urls), return_exceptions=True
+    )
+    points = list(dict.fromkeys(c for c in coords if not isinstance(c, Exception)))
+    addresses = await asyncio.gather(
+        *(bounded(reverse_geocode_async(lat, lng, GOOGLE_API_KEY)) for lat, lng in points), return_exceptions=True
+    )
+    address_by_point = dict(zip(points, addresses))
+
+    sites = {}
+    for url, c in zip(urls, coords):
+        if isinstance(c, Exception):
+            sites[url] = c
+        elif isinstance(address_by_point[c], Exception):
+            sites[url] = address_by_point[c]
+        else:
+            sites[url] = {"latitude": c[0], "longitude": c[1], "address": address_by_point[c], "coords": c}
+    return sites
+
+
+def build_locations(data: MultiPitRequest, sites):
+    """
+    Pick a request's start, dump and pit locations out of resolved sites,
+    raising the first lookup error among them.
+    """
+    locations = []
+    for url in [data.start_url, data.dump_url, *data.pit_urls]:
+        if isinstance(sites[url], Exception):
+            raise sites[url]
+        locations.append(sites[url])
+    pit_locations = [
+        {
+            "index": i + 1,
+            "name": f"Pit {i + 1}",
+            "coords": location["coords"],
+            "address": location["address"]
+        }
+        for i, location in enumerate(locations[2:])
+    ]
+    return locations[0], locations[1], pit_locations
+
+
+async def resolve_locations(data: MultiPitRequest):
+    """
+    Resolve coordinates and addresses for the start, dump and every pit concurrently.
+    """
+    sites = await resolve_sites([data.start_url, data.dump_url, *data.pit_urls])
+    return build_locations(data, sites)
+
+
+async def plan_pit(data: MultiPitRequest, start_coords, dump_coords, pit, prefetched=None):
+    """
+    Resolve a pit's legs concurrently and compute its schedule. Returns the
+    pit result, holding the schedule in compact form (see pit_result_json),
+    and the Schedule its worksheet is built from.
+    """
+    with span("calculate_pit_routes", pit=pit["name"]) as pit_span:
+        route_segments, directions_calls = await resolve_pit_legs_async(
+            start_coords, pit["coords"], dump_coords, prefetched=prefetched,
+            provider=get_provider(data.routing_provider)
+        )
+        schedule = plan_pit_schedule(
+            start_coords=start_coords,
+            pit_coords=pit["coords"],
+            dump_coords=dump_coords,
+            start_time=data.start_time,
+            work_hours=data.work_hours,
+            pit_name=pit["name"],
+            adjust_time=data.adjust_time,
+            route_segments=route_segments,
+            directions_calls=directions_calls
+        )
+        pit_span.set_attributes(
+            directions_calls=directions_calls,
+            total_trips=schedule.total_trips,
+            overtime_minutes=schedule.overtime_minutes
+        )
+    return {
+        "pit_index": pit["index"],
+        "pit_name": pit["name"],
+        "pit_address": pit["address"],
+        "latitude": pit["coords"][0],
+        "longitude": pit["coords"][1],
+        "schedule": schedule.to_compact(),
+        **schedule.summary(),
+        "route_info": schedule.route_info(),
+        "directions_calls": directions_calls
+    }, schedule
+
+
+def pit_result_json(pit_result):
+    """
+    Expand a pit result to its API shape, building the trip dicts of its
+    compact schedule in place of it. Results already expanded pass through.
+    """
+    expanded = {}
+    for key, value in pit_result.items():
+        if key == "schedule":
+            expanded["routes"] = list(Schedule.from_compact(value).routes)
+        else:
+            expanded[key] = value
+    return expanded
+
+
+def create_pit_sheets(data: MultiPitRequest):
+    """
+    Create one worksheet per pit of the request in the request's output
+    sink, in a single call.
+    """
+    sink = get_sink(data.output_sink)
+    with span("create_worksheets", sink=sink.name, count=len(data.pit_materials)):
+        return sink.create_worksheets([f"{data.package}-{material}" for material in data.pit_materials])
+
+
+def pit_sections(data: MultiPitRequest, i, pit_result, schedule, start_location, dump_location):
+    """
+    Build one pit's locations, distance and schedule sections.
+    """
+    return [
+        locations_section(
+            start_location={
+                "latitude": start_location["latitude"],
+                "longitude": start_location["longitude"],
+                "address": start_location["address"]
+            },
+            dump_location={
+                "latitude": dump_location["latitude"],
+                "longitude": dump_location["longitude"],
+                "address": dump_location["address"]
+            },
+            pit_result=pit_result,
+            package=data.package if isinstance(data.package, str) else ""
+        ),
+        distance_section(
+            start_location={
+                "latitude": start_location["latitude"],
+                "longitude": start_location["longitude"]
+            },
+            dump_location={
+                "latitude": dump_location["latitude"],
+                "longitude": dump_location["longitude"]
+            },
+            pit_result=pit_result
+        ),
+        schedule_section(schedule_table(schedule, data.pit_load_sizes[i], data.pit_rates[i]))
+    ]
+
+
+def write_pit_sheet(data: MultiPitRequest, i, pit_result, schedule, start_location, dump_location, sheet=None):
+    """
+    Write one pit's sections to its own worksheet in the request's output
+    sink, created here unless given. Returns a reference to the worksheet.
+    """
+    sink = get_sink(data.output_sink)
+    if sheet is None:
+        with span("create_worksheets", sink=sink.name, count=1):
+            [sheet] = sink.create_worksheets([f"{data.package}-{data.pit_materials[i]}"])
+
+    sections = pit_sections(data, i, pit_result, schedule, start_location, dump_location)
+    with span("write_sections", sink=sink.name, sheet=sheet["title"]):
+        sink.write_sheets([(sheet["title"], sheet["id"], sections)])
+
+    return {"pit_index": pit_result["pit_index"], "title": sheet["title"], "id": sheet["id"]}
+
+
+def queue_pit_sheets(data: MultiPitRequest, pits, start_location, dump_location):
+    """
+    Queue worksheets for (pit number, pit result, schedule) triples with the
+    background sheet writer. Returns a reference per pit to poll the write by.
+    """
+    with span("queue_sheet_write", pits=len(pits)):
+        write_id = sheet_writer.enqueue([
+            {
+                "pit_index": pit_result["pit_index"],
+                "base_name": f"{data.package}-{data.pit_materials[i]}",
+                "sections": pit_sections(data, i, pit_result, schedule, start_location, dump_location)
+            }
+            for i, pit_result, schedule in pits
+        ], get_sink(data.output_sink).name)
+    return [{"pit_index": pit_result["pit_index"], "status": "queued", "write_id": write_id} for _, pit_result, _ in pits]
+
+
+def queues_sheets(data: MultiPitRequest):
+    """
+    True if the request's worksheets go through the background writer:
+    remote sinks in queue mode. Local sinks are written in the request.
+    """
+    return SHEETS_WRITE_MODE == "queue" and get_sink(data.output_sink).remote
+
+
+def sheets_status(sheets):
+    return "queued for sheets" if any(sheet.get("status") == "queued" for sheet in sheets) else "stored in sheets"
+
+
+def uses_distance_matrix(data: MultiPitRequest):
+    use_matrix = data.use_distance_matrix if data.use_distance_matrix is not None else USE_DISTANCE_MATRIX
+    return use_matrix and get_provider(data.routing_provider).name == "google"
+
+
+async def prefetch_pit_legs(data: MultiPitRequest, start_location, dump_location, pit_locations):
+    """
+    In matrix mode fetch every leg with batched Distance Matrix calls;
+    Directions remains the fallback for anything missing. Returns None otherwise.
+    """
+    if not uses_distance_matrix(data):
+        return None
+    return await prefetch_legs_async(
+        start_location["coords"], dump_location["coords"], [pit["coords"] for pit in pit_locations]
+    )
+
+
+async def run_multi_pit_route(data: MultiPitRequest, progress=None):
+    """
+    Run the full pipeline (locations, routing, sheets) and return the pit
+    results with references to the worksheets written.
+    progress(stage, status, **info) is called as stages advance.
+    """
+    def report(stage, status, **info):
+        if progress is not None:
+            progress(stage, status, **info)
+
+    get_sink(data.output_sink)  # Fail fast on an unknown sink, before any lookups
+
+    with pipelines_in_flight.track_inprogress(), stage_seconds.time(stage="total"):
+        # Step 1: Coordinates and addresses for start, dump and pits
+        report("locations", "running")
+        with stage_seconds.time(stage="locations"), span("locations", urls=len(data.pit_urls) + 2):
+            start_location, dump_location, pit_locations = await resolve_locations(data)
+        report("locations", "done", count=len(pit_locations) + 2)
+
+        # Step 2: Route calculations, all pits concurrently
+        report("routing", "running", total=len(pit_locations))
+        with stage_seconds.time(stage="routing"), span("routing", pits=len(pit_locations)):
+            prefetched = await prefetch_pit_legs(data, start_location, dump_location, pit_locations)
+            planned = await asyncio.gather(*(
+                plan_pit(data, start_location["coords"], dump_location["coords"], pit, prefetched)
+                for pit in pit_locations
+            ))
+            pit_results = [pit_result for pit_result, _ in planned]
+        report("routing", "done", total=len(pit_results))
+
+        # Step 3: Write each pit's data to its own sheet, off the event loop
+        report("sheets", "running", done=0, total=len(pit_results))
+        sheets = []
+        with stage_seconds.time(stage="sheets"), span("sheets", pits=len(pit_results)):
+            if queues_sheets(data):
+                sheets = await asyncio.to_thread(
+                    queue_pit_sheets, data, [(i, *plan) for i, plan in enumerate(planned)], start_location, dump_location
+                )
+            else:
+                worksheets = await asyncio.to_thread(create_pit_sheets, data)
+                for i, (pit_result, schedule) in enumerate(planned):
+                    sheets.append(await asyncio.to_thread(
+                        write_pit_sheet, data, i, pit_result, schedule, start_location, dump_location, worksheets[i]
+                    ))
+                    report("sheets", "running", done=i + 1, total=len(pit_results))
+        report("sheets", "queued" if queues_sheets(data) else "done", done=len(sheets), total=len(pit_results))
+
+    return {"pit_results": pit_results, "sheets": sheets}
+
+
+async def get_multi_pit_route(data: MultiPitRequest, idempotency_key=None):
     """
     Calculate routes for multiple pit locations and write each to a separate sheet.
+    A repeat of a completed request returns the stored sheet references instead
+    of planning and writing again; concurrent repeats share one run.
     """
     try:
-        # Step 1: Coordinates and addresses
-        print("hello")
-        start_coords = get_coordinates(data.start_url, GOOGLE_API_KEY)
-        start_address = reverse_geocode(start_coords[0], start_coords[1], GOOGLE_API_KEY)
-        dump_coords = get_coordinates(data.dump_url, GOOGLE_API_KEY)
-        dump_address = reverse_geocode(dump_coords[0], dump_coords[1], GOOGLE_API_KEY)
-
-        # Step 2: Pit site preparation
-        pit_locations = []
-        for i, pit_url in enumerate(data.pit_urls):
-            pit_coords = get_coordinates(pit_url, GOOGLE_API_KEY)
-            pit_address = reverse_geocode(pit_coords[0], pit_coords[1], GOOGLE_API_KEY)
-            pit_locations.append({
-                "index": i + 1,
-                "name": f"Pit {i + 1}",
-                "coords": pit_coords,
-                "address": pit_address
-            })
-
-        # Step 3: Work timing
-        work_hours = data.work_hours
-        scheduled_end_time = datetime.strptime(data.start_time, "%H:%M") + timedelta(hours=work_hours)
-
-        # Step 4: Route calculations
-        pit_results = []
+        result, replayed = await run_once(request_fingerprint(data, idempotency_key), run_multi_pit_route, data)
+        return {"status": sheets_status(result["sheets"]), "sheets": result["sheets"], "replayed": replayed}
+
+    except CircuitOpenError as e:
+        logger.error(f"Upstream unavailable in get_multi_pit_route: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+    except Exception as e:
+        logger.error(f"Error in get_multi_pit_route: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def encode_event(event, payload, stream_format="ndjson"):
+    """
+    Encode one stream event as an NDJSON line or a server-sent event.
+    """
+    body = json.dumps({"event": event, **payload}, default=str)
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {body}\n\n"
+    return body + "\n"
+
+
+async def stream_pit_events(data: MultiPitRequest, start_location, dump_location, pit_locations):
+    """
+    Plan every pit concurrently and yield (event, payload) pairs as they
+    happen: a "pit" event with each result as soon as it is ready, then a
+    "sheet" event once its worksheet is written, or queued for the sheet
+    writer. Sheet writes are serialised so worksheet titles stay unique.
+    """
+    events = asyncio.Queue()
+    sheet_lock = asyncio.Lock()
+    prefetched = await prefetch_pit_legs(data, start_location, dump_location, pit_locations)
+
+    async def run_pit(pit):
+        try:
+            try:
+                pit_result, schedule = await plan_pit(data, start_location["coords"], dump_location["coords"], pit, prefetched)
+            except Exception as e:
+                logger.error(f"Error planning {pit['name']}: {str(e)}")
+                await events.put(("error", {"pit_index": pit["index"], "detail": str(e)}))
+                return
+            await events.put(("pit", pit_result_json(pit_result)))
+
+            async with sheet_lock:
+                try:
+                    if queues_sheets(data):
+                        [payload] = await asyncio.to_thread(
+                            queue_pit_sheets, data, [(pit["index"] - 1, pit_result, schedule)], start_location, dump_location
+                        )
+                    else:
+                        sheet = await asyncio.to_thread(
+                            write_pit_sheet, data, pit["index"] - 1, pit_result, schedule, start_location, dump_location
+                        )
+                        payload = {"pit_index": pit["index"], "status": "stored", "sheet": sheet}
+                except Exception as e:
+                    logger.error(f"Error writing sheet for {pit['name']}: {str(e)}")
+                    await events.put(("sheet", {"pit_index": pit["index"], "status": "failed", "detail": str(e)}))
+                    return
+            await events.put(("sheet", payload))
+        finally:
+            await events.put(None)
+
+    tasks = [asyncio.create_task(run_pit(pit)) for pit in pit_locations]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await events.get()
+            if item is None:
+                remaining -= 1
+            else:
+                yield item
+    finally:
+        # The client went away: stop planning pits nobody will receive
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_multi_pit_route(data: MultiPitRequest, stream_format="ndjson"):
+    """
+    Stream each pit's result, then its sheet-write status, as NDJSON or SSE.
+    Locations are resolved up front so lookup failures still map to an
+    HTTP error status.
+    """
+    try:
+        get_sink(data.output_sink)
+        start_location, dump_location, pit_locations = await resolve_locations(data)
+    except CircuitOpenError as e:
+        logger.error(f"Upstream unavailable in stream_multi_pit_route: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+    except Exception as e:
+        logger.error(f"Error in stream_multi_pit_route: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def body():
+        yield encode_event("locations", {
+            "start_location": {key: start_location[key] for key in ("latitude", "longitude", "address")},
+            "dump_location": {key: dump_location[key] for key in ("latitude", "longitude", "address")},
+            "pit_count": len(pit_locations)
+        }, stream_format)
+        counts = {"pits": 0, "sheets_stored": 0, "sheets_queued": 0, "errors": 0}
+        try:
+            async for event, payload in stream_pit_events(data, start_location, dump_location, pit_locations):
+                if event == "pit":
+                    counts["pits"] += 1
+                elif event == "sheet" and payload["status"] in ("stored", "queued"):
+                    counts[f"sheets_{payload['status']}"] += 1
+                else:
+                    counts["errors"] += 1
+                yield encode_event(event, payload, stream_format)
+        except Exception as e:
+            logger.error(f"Error in stream_multi_pit_route: {str(e)}")
+            yield encode_event("error", {"detail": str(e)}, stream_format)
+            return
+        yield encode_event("done", counts, stream_format)
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+
+async def resolve_batch_legs(plans):
+    """
+    Resolve the union of legs needed by every planned request once, grouped
+    by routing provider and Distance Matrix mode. Returns {group: (legs, errors)}.
+    """
+    groups = {}
+    for data, start_location, dump_location, pit_locations in plans:
+        pairs = groups.setdefault((get_provider(data.routing_provider).name, uses_distance_matrix(data)), [])
         for pit in pit_locations:
-            result = calculate_pit_routes(
-                start_coords=start_coords,
-                pit_coords=pit["coords"],
-                dump_coords=dump_coords,
-                start_time=data.start_time,
-                work_hours=work_hours,
-                pit_name=pit["name"],
-                adjust_time=data.adjust_time,
-            )
-            pit_results.append({
-                "pit_index": pit["index"],
-                "pit_name": pit["name"],
-                "pit_address": pit["address"],
-                "latitude": pit["coords"][0],
-                "longitude": pit["coords"][1],
-                **result
-            })
-            print("\n\nPit Results:", pit_results, "\n\n")
-
-        # Step 5: Write each pit's data to its own sheet
-        for i, pit_result in enumerate(pit_results):
-            sheet = get_or_create_unique_worksheet(f"{data.package}-{data.pit_materials[i]}")
-
-            write_locations_section(
-                sheet=sheet,
-                start_location={
-                    "latitude": start_coords[0],
-                    "longitude": start_coords[1],
-                    "address": start_address
-                },
-                dump_location={
-                    "latitude": dump_coords[0],
-                    "longitude": dump_coords[1],
-                    "address": dump_address
-                },
-                pit_result=pit_result,
-                package=data.package if isinstance(data.package, str) else ""
+            pairs.extend(
+                p for p in pit_leg_pairs(start_location["coords"], pit["coords"], dump_location["coords"]).values()
+                if p is not None
             )
 
-            time.sleep(1)
-
-            write_distance_section(
-                sheet=sheet,
-                start_location={
-                    "latitude": start_coords[0],
-                    "longitude": start_coords[1]
-                },
-                dump_location={
-                    "latitude": dump_coords[0],
-                    "longitude": dump_coords[1]
-                },
-                pit_result=pit_result
-            )
+    resolved = {}
+    for (provider_name, use_matrix), pairs in groups.items():
+        pairs = list(dict.fromkeys(pairs))
+        legs = await get_leg_matrix_async(pairs, GOOGLE_API_KEY) if use_matrix else {}
+        fetched, errors = await resolve_legs_async(
+            [p for p in pairs if p not in legs], provider=get_provider(provider_name)
+        )
+        resolved[(provider_name, use_matrix)] = ({**legs, **fetched}, errors)
+    return resolved
 
-            time.sleep(1)
 
-            write_schedule_section(
-                sheet=sheet,
-                pit_result=pit_result,
-                start_time_str=data.start_time,
-                adjust_time=data.adjust_time,
-                load_size=data.pit_load_sizes[i],
-                rate_per_tonne=data.pit_rates[i],
-                total_trips=pit_results[i]["total_trips"]
-            )
+async def run_batch_multi_pit_route(batch: BatchMultiPitRequest):
+    """
+    Plan many multi-pit requests together: every distinct URL and leg across
+    the batch is resolved once with bounded parallelism, then each request
+    is scheduled from the shared results. A failure only affects the
+    requests that needed the failing site or leg.
+    """
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise Exception(f"A batch may hold at most {BATCH_MAX_REQUESTS} requests")
+
+    # Step 1: Every distinct URL across the batch, once
+    urls = [url for data in batch.requests for url in [data.start_url, data.dump_url, *data.pit_urls]]
+    sites = await resolve_sites(urls, limit=BATCH_CONCURRENCY)
+    for site in sites.values():
+        if isinstance(site, CircuitOpenError):
+            raise site
+
+    results = [None] * len(batch.requests)
+    plans = []
+    for n, data in enumerate(batch.requests):
+        try:
+            plans.append((n, (data, *build_locations(data, sites))))
+        except Exception as e:
+            results[n] = {"index": n, "status": "failed", "detail": str(e)}
+
+    # Step 2: Every distinct leg across the batch, once
+    resolved = await resolve_batch_legs([plan for _, plan in plans])
+
+    # Step 3: Schedules from the shared legs, then sheets one request at a time
+    for n, (data, start_location, dump_location, pit_locations) in plans:
+        legs, errors = resolved[(get_provider(data.routing_provider).name, uses_distance_matrix(data))]
+        try:
+            for pit in pit_locations:
+                for p in pit_leg_pairs(start_location["coords"], pit["coords"], dump_location["coords"]).values():
+                    if p in errors:
+                        raise errors[p]
+            planned = await asyncio.gather(*(
+                plan_pit(data, start_location["coords"], dump_location["coords"], pit, legs)
+                for pit in pit_locations
+            ))
+            sheets = []
+            if batch.write_sheets and queues_sheets(data):
+                sheets = await asyncio.to_thread(
+                    queue_pit_sheets, data, [(i, *plan) for i, plan in enumerate(planned)], start_location, dump_location
+                )
+            elif batch.write_sheets:
+                worksheets = await asyncio.to_thread(create_pit_sheets, data)
+                for i, (pit_result, schedule) in enumerate(planned):
+                    sheets.append(await asyncio.to_thread(
+                        write_pit_sheet, data, i, pit_result, schedule, start_location, dump_location, worksheets[i]
+                    ))
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in batch request {n}: {str(e)}")
+            results[n] = {"index": n, "status": "failed", "detail": str(e)}
+            continue
+        results[n] = {
+            "index": n,
+            "status": sheets_status(sheets) if batch.write_sheets else "ok",
+            "pit_results": [pit_result_json(pit_result) for pit_result, _ in planned],
+            "sheets": sheets
+        }
 
-        return {"status": "stored in sheets"}
+    return {
+        "results": results,
+        "distinct_sites": len(sites),
+        "distinct_legs": sum(len(legs) + len(errors) for legs, errors in resolved.values())
+    }
 
+
+async def get_batch_multi_pit_route(batch: BatchMultiPitRequest):
+    """
+    Calculate routes for a batch of multi-pit requests with shared lookups.
+    """
+    try:
+        return await run_batch_multi_pit_route(batch)
+
+    except CircuitOpenError as e:
+        logger.error(f"Upstream unavailable in get_batch_multi_pit_route: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
     except Exception as e:
-        logger.error(f"Error in get_multi_pit_route: {str(e)}")
+        logger.error(f"Error in get_batch_multi_pit_route: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,258 @@
+import json
+import time
+import uuid
+import logging
+import threading
+
+from fastapi import HTTPException
+
+from app.utils.cache import sqlite_connection
+from app.utils.governor import backoff_delay
+from app.utils.sinks import get_sink
+from app.utils.metrics import REGISTRY, Counter, Gauge
+from app.config import (
+    SHEETS_QUEUE_PATH,
+    SHEETS_WRITE_BATCH,
+    SHEETS_WRITE_MAX_ATTEMPTS,
+    SHEETS_WRITE_BACKOFF_BASE_SECONDS,
+    SHEETS_WRITE_BACKOFF_MAX_SECONDS,
+    SHEETS_WRITE_LEASE_SECONDS,
+    SHEETS_WRITE_RETENTION_SECONDS
+)
+
+logger = logging.getLogger("app.sheet_writes")
+
+COLUMNS = "id, sink, status, created_at, updated_at, attempts, due_at, payload, sheets, error"
+
+
+class SheetWriteStore:
+    """
+    Pending worksheet writes in a SQLite table shared by every server
+    process on the host. A claimed write is leased: if its writer dies, the
+    write becomes due again once the lease runs out.
+    """
+
+    def __init__(self, path=SHEETS_QUEUE_PATH):
+        self.path = path
+        self._ready = False
+
+    def _conn(self):
+        conn = sqlite_connection(self.path)
+        if not self._ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_writes (id TEXT PRIMARY KEY, status TEXT, created_at REAL, "
+                "updated_at REAL, attempts INTEGER, due_at REAL, payload TEXT, sheets TEXT, error TEXT, sink TEXT)"
+            )
+            if "sink" not in [column[1] for column in conn.execute("PRAGMA table_info(sheet_writes)")]:
+                conn.execute("ALTER TABLE sheet_writes ADD COLUMN sink TEXT DEFAULT 'sheets'")
+            conn.execute("CREATE INDEX IF NOT EXISTS sheet_writes_due ON sheet_writes (status, due_at)")
+            self._ready = True
+        return conn
+
+    @staticmethod
+    def _record(row):
+        write_id, sink, status, created_at, updated_at, attempts, due_at, payload, sheets, error = row
+        return {
+            "id": write_id,
+            "sink": sink,
+            "status": status,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "attempts": attempts,
+            "due_at": due_at,
+            "pits": json.loads(payload),
+            "sheets": json.loads(sheets) if sheets else None,
+            "error": error
+        }
+
+    def add(self, pits, sink="sheets"):
+        """
+        Queue worksheets to write to an output sink, each {"pit_index",
+        "base_name", "sections"}. Returns the write id.
+        """
+        write_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            f"INSERT INTO sheet_writes ({COLUMNS}) VALUES (?, ?, 'pending', ?, ?, 0, ?, ?, NULL, NULL)",
+            (write_id, sink, now, now, now, json.dumps(pits, default=str))
+        )
+        return write_id
+
+    def claim(self, limit):
+        """
+        Lease up to limit due writes, oldest first, and count the attempt.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT {COLUMNS} FROM sheet_writes WHERE status IN ('pending', 'writing') AND due_at <= ? "
+                "ORDER BY created_at LIMIT ?", (now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE sheet_writes SET status = 'writing', attempts = attempts + 1, due_at = ?, updated_at = ? WHERE id = ?",
+                [(now + SHEETS_WRITE_LEASE_SECONDS, now, row[0]) for row in rows]
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        claimed = [self._record(row) for row in rows]
+        for write in claimed:
+            write["status"] = "writing"
+            write["attempts"] += 1
+        return claimed
+
+    def set_sheets(self, write_id, sheets):
+        # Recorded before the values go out, so a retry reuses these worksheets
+        self._conn().execute(
+            "UPDATE sheet_writes SET sheets = ?, updated_at = ? WHERE id = ?", (json.dumps(sheets), time.time(), write_id)
+        )
+
+    def finish(self, write_id, status, error=None, due_at=None):
+        self._conn().execute(
+            "UPDATE sheet_writes SET status = ?, error = ?, due_at = COALESCE(?, due_at), updated_at = ? WHERE id = ?",
+            (status, error, due_at, time.time(), write_id)
+        )
+
+    def get(self, write_id):
+        row = self._conn().execute(f"SELECT {COLUMNS} FROM sheet_writes WHERE id = ?", (write_id,)).fetchone()
+        return self._record(row) if row is not None else None
+
+    def depth(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sheet_writes WHERE status IN ('pending', 'writing')").fetchone()[0]
+
+    def prune(self):
+        self._conn().execute(
+            "DELETE FROM sheet_writes WHERE status IN ('written', 'failed') AND updated_at < ?",
+            (time.time() - SHEETS_WRITE_RETENTION_SECONDS,)
+        )
+
+
+class SheetWriter:
+    """
+    Background thread draining the sheet write queue. Due writes are taken
+    SHEETS_WRITE_BATCH at a time and sent together per output sink: for
+    Sheets, one addSheet call for their new worksheets, one values update
+    and one formatting update.
+    """
+
+    def __init__(self, store, batch_size=SHEETS_WRITE_BATCH, poll_seconds=1.0):
+        self.store = store
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self):
+        if self.running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheet-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        # Writes still queued stay in the table and are sent after the next start
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def enqueue(self, pits, sink="sheets"):
+        write_id = self.store.add(pits, sink)
+        self._wake.set()
+        return write_id
+
+    def _run(self):
+        rounds = 0
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                if rounds % 1000 == 0:
+                    self.store.prune()
+                rounds += 1
+                if self.drain_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Sheet writer error: {e}")
+            self._wake.wait(self.poll_seconds)
+
+    def drain_once(self):
+        """
+        Write one batch of due writes. Returns False if nothing was due.
+        """
+        writes = self.store.claim(self.batch_size)
+        if not writes:
+            return False
+        try:
+            self._write(writes)
+        except Exception as e:
+            if len(writes) == 1:
+                self._failed(writes[0], e)
+            else:
+                # Retry one at a time so a single bad write cannot hold back the rest
+                logger.warning(f"Batched write of {len(writes)} sheet writes failed, writing separately: {e}")
+                for write in writes:
+                    try:
+                        self._write([write])
+                    except Exception as e:
+                        self._failed(write, e)
+        return True
+
+    def _write(self, writes):
+        by_sink = {}
+        for write in writes:
+            by_sink.setdefault(write["sink"], []).append(write)
+        for name, sink_writes in by_sink.items():
+            sink = get_sink(name)
+            new = [write for write in sink_writes if write["sheets"] is None]
+            if new:
+                refs = iter(sink.create_worksheets([pit["base_name"] for write in new for pit in write["pits"]]))
+                for write in new:
+                    write["sheets"] = [{"pit_index": pit["pit_index"], **ref} for pit, ref in zip(write["pits"], refs)]
+                    self.store.set_sheets(write["id"], write["sheets"])
+            sink.write_sheets([
+                (sheet["title"], sheet["id"], pit["sections"])
+                for write in sink_writes for pit, sheet in zip(write["pits"], write["sheets"])
+            ])
+        for write in writes:
+            self.store.finish(write["id"], "written")
+            sheet_writes_total.inc(status="written")
+
+    def _failed(self, write, error):
+        if write["attempts"] >= SHEETS_WRITE_MAX_ATTEMPTS:
+            logger.error(f"Sheet write {write['id']} failed after {write['attempts']} attempts: {error}")
+            self.store.finish(write["id"], "failed", str(error))
+            sheet_writes_total.inc(status="failed")
+            return
+        delay = backoff_delay(write["attempts"] - 1, base=SHEETS_WRITE_BACKOFF_BASE_SECONDS, cap=SHEETS_WRITE_BACKOFF_MAX_SECONDS)
+        logger.warning(f"Sheet write {write['id']} failed, retrying in {delay:.0f}s: {error}")
+        self.store.finish(write["id"], "pending", str(error), due_at=time.time() + delay)
+        sheet_writes_total.inc(status="retried")
+
+
+sheet_writer = SheetWriter(SheetWriteStore())
+
+sheet_write_queue_depth = Gauge("sheet_write_queue_depth", "Sheet writes waiting to be written or being written.")
+sheet_writes_total = Counter("sheet_writes_total", "Queued sheet writes by outcome.", ["status"])
+
+
+@REGISTRY.register_collector
+def collect_sheet_writes():
+    sheet_write_queue_depth.set(sheet_writer.store.depth())
+
+
+def get_sheet_write_status(write_id: str):
+    """
+    Return a queued sheet write's status and, once created, its worksheets.
+    """
+    write = sheet_writer.store.get(write_id)
+    if write is None:
+        raise HTTPException(status_code=404, detail=f"Sheet write {write_id} not found")
+    return {key: value for key, value in write.items() if key not in ("pits", "due_at")}
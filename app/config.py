@@ -4,11 +4,134 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+# Logging: DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
 # API settings
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "YOUR_DEFAULT_API_KEY")
 
+# Google Sheets output (opened lazily on first write)
+SHEETS_CREDENTIALS_PATH = os.getenv("SHEETS_CREDENTIALS_PATH", "sheets.json")
+SPREADSHEET_URL = os.getenv(
+    "SPREADSHEET_URL",
+    "https://docs.google.com/spreadsheets/d/12-NJ-M4DpgCKU5h1Tg4Zj7qhRdQO5vzuUFRDMiVLDk0/edit#gid=0"
+)
+# Sheets API request budget (the default write quota is 60 requests/minute/user)
+SHEETS_API_QPS = float(os.getenv("SHEETS_API_QPS", "1"))
+SHEETS_API_BURST = float(os.getenv("SHEETS_API_BURST", "10"))
+
 # Constants for time calculations
 LOADING_TIME_MINUTES = 20
 UNLOADING_TIME_MINUTES = 20
 WORK_HOURS = 10  # Default work hours
-OVERTIME_ALLOWANCE_MINUTES = 50  # Allow trips that go up to 10 minutes over the end time
\ No newline at end of file
+OVERTIME_ALLOWANCE_MINUTES = 50  # Allow trips that go up to 10 minutes over the end time
+
+# Geocoding cache settings
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "coordinates_cache.json")
+GEOCODE_CACHE_TTL_SECONDS = int(os.getenv("GEOCODE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "10000"))
+
+# Reverse geocoding cache settings (set the path to "" to keep it in memory only)
+REVERSE_GEOCODE_CACHE_PATH = os.getenv("REVERSE_GEOCODE_CACHE_PATH", "reverse_geocode_cache.json")
+REVERSE_GEOCODE_CACHE_TTL_SECONDS = int(os.getenv("REVERSE_GEOCODE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+REVERSE_GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("REVERSE_GEOCODE_CACHE_MAX_ENTRIES", "5000"))
+REVERSE_GEOCODE_GEOHASH_PRECISION = int(os.getenv("REVERSE_GEOCODE_GEOHASH_PRECISION", "8"))  # 8 chars ~ 38m x 19m cells
+
+# Directions cache settings (set the path to "" to keep it in memory only)
+DIRECTIONS_CACHE_PATH = os.getenv("DIRECTIONS_CACHE_PATH", "directions_cache.json")
+DIRECTIONS_CACHE_TTL_SECONDS = int(os.getenv("DIRECTIONS_CACHE_TTL_SECONDS", str(24 * 3600)))
+DIRECTIONS_CACHE_MAX_ENTRIES = int(os.getenv("DIRECTIONS_CACHE_MAX_ENTRIES", "20000"))
+DIRECTIONS_CACHE_BUCKET_MINUTES = int(os.getenv("DIRECTIONS_CACHE_BUCKET_MINUTES", "60"))
+
+# Hard cap on Directions lookups per pit (start->pit, pit->dump, dump->pit, dump->start, pit->start)
+MAX_DIRECTIONS_CALLS_PER_PIT = int(os.getenv("MAX_DIRECTIONS_CALLS_PER_PIT", "5"))
+
+# Outbound HTTP client settings (shared keep-alive pool for Google Maps calls)
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+
+# Distance Matrix batching (per-request limits of the Google API)
+USE_DISTANCE_MATRIX = os.getenv("USE_DISTANCE_MATRIX", "false").lower() == "true"
+DISTANCE_MATRIX_MAX_ORIGINS = int(os.getenv("DISTANCE_MATRIX_MAX_ORIGINS", "25"))
+DISTANCE_MATRIX_MAX_DESTINATIONS = int(os.getenv("DISTANCE_MATRIX_MAX_DESTINATIONS", "25"))
+DISTANCE_MATRIX_MAX_ELEMENTS = int(os.getenv("DISTANCE_MATRIX_MAX_ELEMENTS", "100"))
+
+# Outbound Google API governor: global QPS bucket, per-endpoint QPS budgets,
+# retries with jittered exponential backoff and a per-endpoint circuit breaker
+GOOGLE_API_QPS = float(os.getenv("GOOGLE_API_QPS", "40"))
+GOOGLE_API_BURST = float(os.getenv("GOOGLE_API_BURST", "20"))
+GOOGLE_API_ENDPOINT_QPS = os.getenv("GOOGLE_API_ENDPOINT_QPS", "geocode=20,directions=20,distancematrix=5,unshorten=10")
+GOOGLE_API_MAX_ATTEMPTS = int(os.getenv("GOOGLE_API_MAX_ATTEMPTS", "4"))
+GOOGLE_API_BACKOFF_BASE_SECONDS = float(os.getenv("GOOGLE_API_BACKOFF_BASE_SECONDS", "0.5"))
+GOOGLE_API_BACKOFF_MAX_SECONDS = float(os.getenv("GOOGLE_API_BACKOFF_MAX_SECONDS", "8"))
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
+
+# Maximum redirect hops followed when resolving short Maps links
+MAX_REDIRECT_HOPS = int(os.getenv("MAX_REDIRECT_HOPS", "8"))
+
+# Routing provider: "google" (live Directions), "local" (offline road graph
+# with straight-line fallback) or "haversine" (straight-line estimate only)
+ROUTING_PROVIDER = os.getenv("ROUTING_PROVIDER", "google")
+LOCAL_GRAPH_PATH = os.getenv("LOCAL_GRAPH_PATH", "")  # OSM-derived edge list CSV
+LOCAL_GRAPH_MAX_SNAP_METERS = float(os.getenv("LOCAL_GRAPH_MAX_SNAP_METERS", "2000"))
+ESTIMATOR_SPEED_KPH = float(os.getenv("ESTIMATOR_SPEED_KPH", "60"))
+ESTIMATOR_DETOUR_FACTOR = float(os.getenv("ESTIMATOR_DETOUR_FACTOR", "1.3"))
+
+# Geocoding: "google" (Geocoding API for place names and addresses) or "none"
+# (coordinates from the Maps URLs only; addresses are not looked up)
+GEOCODING_PROVIDER = os.getenv("GEOCODING_PROVIDER", "google")
+
+# Background job queue for /jobs/multi-pit-route
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "500"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# Batch planning (/get-multi-pit-route/batch)
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))  # Distinct sites/legs resolved at once
+
+# Idempotent replays of identical multi-pit requests
+IDEMPOTENCY_CACHE_PATH = os.getenv("IDEMPOTENCY_CACHE_PATH", "idempotency_cache.json")
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_CACHE_MAX_ENTRIES", "1000"))
+
+# Request tracing: "jsonl" (append trace trees to TRACE_JSONL_PATH), "otlp"
+# (POST OTLP/JSON to TRACE_OTLP_ENDPOINT) or "none"
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl")
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "2000"))  # Per trace; extra spans are dropped
+
+# Multi-process serving. With more than one worker the caches, single-flight
+# locks and Google quota buckets move to state shared by every process.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite" if WEB_CONCURRENCY > 1 else "json")  # "json" or "sqlite"
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "cache.db")  # SQLite (WAL) file for caches and quota buckets
+CACHE_FLUSH_SECONDS = float(os.getenv("CACHE_FLUSH_SECONDS", "2"))  # JSON cache files are rewritten at most this often
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite" if WEB_CONCURRENCY > 1 else "memory")  # "memory" or "sqlite"
+SHARED_LOCK_DIR = os.getenv("SHARED_LOCK_DIR", ".locks" if WEB_CONCURRENCY > 1 else "")  # Cross-process single-flight; "" disables
+
+# Sheets output: "queue" answers once schedules are computed and a background
+# writer drains a durable SQLite queue of worksheet writes; "sync" writes
+# every worksheet before responding
+SHEETS_WRITE_MODE = os.getenv("SHEETS_WRITE_MODE", "queue")
+SHEETS_QUEUE_PATH = os.getenv("SHEETS_QUEUE_PATH", "sheets_queue.db")
+SHEETS_WRITE_BATCH = int(os.getenv("SHEETS_WRITE_BATCH", "20"))  # Queued writes coalesced per round of API calls
+SHEETS_WRITE_MAX_ATTEMPTS = int(os.getenv("SHEETS_WRITE_MAX_ATTEMPTS", "8"))
+SHEETS_WRITE_BACKOFF_BASE_SECONDS = float(os.getenv("SHEETS_WRITE_BACKOFF_BASE_SECONDS", "5"))
+SHEETS_WRITE_BACKOFF_MAX_SECONDS = float(os.getenv("SHEETS_WRITE_BACKOFF_MAX_SECONDS", "600"))
+SHEETS_WRITE_LEASE_SECONDS = float(os.getenv("SHEETS_WRITE_LEASE_SECONDS", "300"))  # A crashed writer's batch is retried after this
+SHEETS_WRITE_RETENTION_SECONDS = int(os.getenv("SHEETS_WRITE_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# Output sink for pit worksheets, overridable per request: "sheets" (the
+# Google spreadsheet above), "csv", "xlsx", "sqlite" (local files) or
+# "memory" (in-process fake for offline and load tests)
+OUTPUT_SINK = os.getenv("OUTPUT_SINK", "sheets")
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "output")  # One CSV per worksheet
+OUTPUT_XLSX_PATH = os.getenv("OUTPUT_XLSX_PATH", os.path.join(OUTPUT_DIR, "routes.xlsx"))
+OUTPUT_SQLITE_PATH = os.getenv("OUTPUT_SQLITE_PATH", os.path.join(OUTPUT_DIR, "routes.db"))
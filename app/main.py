@@ -1,12 +1,19 @@
 import logging
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, JSONResponse
 
-from app.models import MultiPitRequest
-from app.api.routes import get_multi_pit_route
+from app.models import MultiPitRequest, BatchMultiPitRequest
+from app.api.routes import get_multi_pit_route, stream_multi_pit_route, get_batch_multi_pit_route
+from app.api.jobs import job_queue, submit_multi_pit_job, get_job_status
+from app.api.sheet_writes import sheet_writer, get_sheet_write_status
+from app.api.health import readiness_checks
+from app.utils import cache, http, metrics, tracing
+from app.config import LOG_LEVEL
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger("app")
 
 app = FastAPI()
@@ -20,6 +27,62 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Record a trace per request and return its id in the X-Trace-Id header
+    """
+    if request.url.path in ("/metrics", "/healthz", "/readyz"):
+        return await call_next(request)
+    trace_id = tracing.parse_traceparent(request.headers.get("traceparent"))
+    with tracing.span(f"{request.method} {request.url.path}", trace_id=trace_id) as root:
+        response = await call_next(request)
+        root.set_attribute("http.status_code", response.status_code)
+    response.headers["X-Trace-Id"] = root.trace_id
+    return response
+
+@app.on_event("startup")
+async def start_job_workers():
+    """
+    Start the background job workers and resume unfinished jobs
+    """
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """
+    Stop the background job workers; unfinished jobs resume on next start
+    """
+    await job_queue.stop()
+
+@app.on_event("startup")
+def start_sheet_writer():
+    """
+    Start the background writer draining queued sheet writes
+    """
+    sheet_writer.start()
+
+@app.on_event("shutdown")
+def stop_sheet_writer():
+    """
+    Stop the sheet writer; queued writes are kept and sent on next start
+    """
+    sheet_writer.stop()
+
+@app.on_event("shutdown")
+def flush_caches():
+    """
+    Write pending cache changes to their stores
+    """
+    cache.flush_stores()
+
+@app.on_event("shutdown")
+def close_http_client():
+    """
+    Close the pooled Google Maps HTTP client
+    """
+    http.close()
+
 @app.get("/")
 async def root():
     """
@@ -27,9 +90,66 @@ async def root():
     """
     return {"message": "Route planning API is running"}
 
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness: the process is up and serving
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness from local state only; never calls Google or opens the spreadsheet
+    """
+    ready, details = readiness_checks()
+    return JSONResponse({"status": "ready" if ready else "not ready", **details}, status_code=200 if ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Pipeline, upstream, cache and in-flight metrics in Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/get-multi-pit-route")
-async def route_multi_pit(data: MultiPitRequest):
+async def route_multi_pit(data: MultiPitRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Calculate routes for multiple pit locations; identical repeats replay the stored result
+    """
+    return await get_multi_pit_route(data, idempotency_key)
+
+@app.post("/get-multi-pit-route/batch")
+async def route_multi_pit_batch(batch: BatchMultiPitRequest):
+    """
+    Calculate routes for many multi-pit requests, resolving shared sites and legs once
+    """
+    return await get_batch_multi_pit_route(batch)
+
+@app.post("/get-multi-pit-route/stream")
+async def route_multi_pit_stream(data: MultiPitRequest, stream_format: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$")):
+    """
+    Stream each pit's schedule, then its sheet-write status, as NDJSON or SSE (?format=sse)
+    """
+    return await stream_multi_pit_route(data, stream_format)
+
+@app.post("/jobs/multi-pit-route", status_code=202)
+async def submit_multi_pit_route_job(data: MultiPitRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Queue a multi-pit route calculation and return a job id to poll; identical repeats share a job
+    """
+    return await submit_multi_pit_job(data, idempotency_key)
+
+@app.get("/jobs/{job_id}")
+async def multi_pit_route_job(job_id: str):
+    """
+    Poll a queued multi-pit route job
+    """
+    return get_job_status(job_id)
+
+@app.get("/sheets/writes/{write_id}")
+async def sheet_write_status(write_id: str):
     """
-    Calculate routes for multiple pit locations
+    Poll a queued sheet write; its worksheets are listed once created
     """
-    return await get_multi_pit_route(data)
+    return get_sheet_write_status(write_id)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, model_validator
+from typing import List, Literal, Optional
 
 # Pydantic model to accept user input with multiple pit locations
 class MultiPitRequest(BaseModel):
@@ -14,4 +14,23 @@ class MultiPitRequest(BaseModel):
     adjust_time: int = 0
     pit_load_sizes: List[float]
     pit_rates: List[float]
+    use_distance_matrix: Optional[bool] = None  # Defaults to USE_DISTANCE_MATRIX
+    routing_provider: Optional[Literal["google", "local", "haversine"]] = None  # Defaults to ROUTING_PROVIDER
+    output_sink: Optional[Literal["sheets", "csv", "xlsx", "sqlite", "memory"]] = None  # Defaults to OUTPUT_SINK
 
+    @model_validator(mode="after")
+    def check_pit_lists(self):
+        # Every per-pit list is indexed alongside pit_urls
+        for field in ("pit_materials", "pit_tonnes", "pit_load_sizes", "pit_rates"):
+            if len(getattr(self, field)) != len(self.pit_urls):
+                raise ValueError(
+                    f"{field} has {len(getattr(self, field))} entries but pit_urls has {len(self.pit_urls)}"
+                )
+        return self
+
+
+
+# Many multi-pit requests planned together, sharing site and leg lookups
+class BatchMultiPitRequest(BaseModel):
+    requests: List[MultiPitRequest]
+    write_sheets: bool = True
@@ -0,0 +1,560 @@
+import os
+import json
+import time
+import atexit
+import logging
+import sqlite3
+import tempfile
+import weakref
+import threading
+from collections import OrderedDict
+
+from app.config import CACHE_BACKEND, CACHE_DB_PATH, CACHE_FLUSH_SECONDS
+
+logger = logging.getLogger("app.cache")
+
+_MISSING = object()
+
+# Every live TTLCache, for metrics
+_caches = weakref.WeakSet()
+
+# Every live store that buffers writes, flushed at shutdown
+_buffered_stores = weakref.WeakSet()
+
+
+def atomic_write_json(path, data):
+    """
+    Write JSON to path atomically: dump to a temp file in the same directory,
+    fsync it and rename it over the target so a crash never leaves a torn file.
+    """
+    atomic_write_text(path, json.dumps(data))
+
+
+def atomic_write_text(path, text):
+    """
+    Write already encoded text to path atomically, like atomic_write_json.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class JSONFileStore:
+    """
+    Persistent key/value store backed by a single JSON file.
+
+    Entries are written as {"value": ..., "expires_at": ...}. Bare values (the
+    format of the original coordinates_cache.json) are read as never expiring.
+    The file is loaded lazily on first use. Changes are written atomically by
+    a timer thread at most every flush_seconds, so callers never wait on the
+    rewrite; flush_seconds=0 writes on every change.
+    """
+
+    shared = False
+
+    def __init__(self, path, max_entries=10000, legacy_filter=None, flush_seconds=CACHE_FLUSH_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.legacy_filter = legacy_filter
+        self.flush_seconds = flush_seconds
+        self._entries = None
+        self._dirty = False
+        self._timer = None
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        _buffered_stores.add(self)
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+        entries = OrderedDict()
+        try:
+            with open(self.path) as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            raw = {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read cache file {self.path}: {e}")
+            raw = {}
+        for key, item in raw.items():
+            if isinstance(item, dict) and set(item) == {"value", "expires_at"}:
+                entries[key] = (item["value"], item["expires_at"])
+            elif self.legacy_filter is None or self.legacy_filter(key):
+                entries[key] = (item, None)
+        self._entries = entries
+        logger.debug(f"Loaded {len(entries)} entries from {self.path}")
+        return entries
+
+    def _changed(self):
+        # Called with self._lock held after a change
+        self._dirty = True
+        if self.flush_seconds <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.flush_seconds, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """
+        Write pending changes to the file now.
+        """
+        # Snapshots are taken and written in order, so an older one never lands last
+        with self._write_lock:
+            with self._lock:
+                self._timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                now = time.time()
+                entries = self._entries
+                for key in [k for k, (_, exp) in entries.items() if exp is not None and exp <= now]:
+                    del entries[key]
+                while len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+                snapshot = {
+                    key: {"value": value, "expires_at": expires_at}
+                    for key, (value, expires_at) in entries.items()
+                }
+            try:
+                atomic_write_json(self.path, snapshot)
+            except (OSError, TypeError, ValueError) as e:
+                logger.error(f"Could not write cache file {self.path}: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            entries = self._load()
+            entries.pop(key, None)
+            entries[key] = (value, expires_at)
+            self._changed()
+
+    def delete(self, key):
+        with self._lock:
+            if self._load().pop(key, None) is not None:
+                self._changed()
+
+    def delete_where(self, predicate):
+        with self._lock:
+            entries = self._load()
+            keys = [key for key in entries if predicate(key)]
+            for key in keys:
+                del entries[key]
+            if keys:
+                self._changed()
+            return keys
+
+    def clear(self):
+        with self._lock:
+            self._load().clear()
+            self._changed()
+
+
+_connections = threading.local()
+
+
+def sqlite_connection(path):
+    """
+    Return this thread's connection to the SQLite file at path, opened in
+    WAL mode so many processes can read while one writes.
+    """
+    conns = getattr(_connections, "by_path", None)
+    if conns is None:
+        conns = _connections.by_path = {}
+    conn = conns.get(path)
+    if conn is None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conns[path] = conn
+    return conn
+
+
+class SQLiteStore:
+    """
+    Persistent key/value store in a shared SQLite database, one namespace per
+    cache. Safe to use from many threads and processes at once; this is the
+    shared cache tier when the server runs several workers. Invalidations
+    (delete_where, clear) bump the namespace's generation so every process
+    can tell its in-memory copies are stale.
+
+    set and delete only queue the change; a writer thread commits queued
+    changes in batches, and reads in this process see them straight away.
+    flush() waits until they are visible to other processes too.
+    """
+
+    shared = True
+    _PRUNE_EVERY = 100
+
+    def __init__(self, path, namespace, max_entries=10000):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._writes = 0
+        self._ready = False
+        self._lock = threading.Lock()
+        # key -> (encoded value, expires_at), or None for a delete
+        self._pending = OrderedDict()
+        self._writing = False
+        self._writer = None
+        self._queued = threading.Condition()
+        self._write_lock = threading.Lock()
+        _buffered_stores.add(self)
+
+    def _conn(self):
+        conn = sqlite_connection(self.path)
+        if not self._ready:
+            with self._lock:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                    " expires_at REAL, updated_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS cache_updated ON cache (namespace, updated_at)")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_generations (namespace TEXT PRIMARY KEY, generation INTEGER NOT NULL)"
+                )
+                self._ready = True
+        return conn
+
+    def generation(self):
+        row = self._conn().execute(
+            "SELECT generation FROM cache_generations WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        return row[0] if row is not None else 0
+
+    def _bump_generation(self, conn):
+        conn.execute(
+            "INSERT INTO cache_generations (namespace, generation) VALUES (?, 1) "
+            "ON CONFLICT (namespace) DO UPDATE SET generation = generation + 1",
+            (self.namespace,)
+        )
+
+    def get(self, key):
+        with self._queued:
+            if key in self._pending:
+                item = self._pending[key]
+                return None if item is None else (json.loads(item[0]), item[1])
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        self._queue(key, (json.dumps(value), expires_at))
+
+    def delete(self, key):
+        self._queue(key, None)
+
+    def _queue(self, key, item):
+        with self._queued:
+            self._pending.pop(key, None)
+            self._pending[key] = item
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._write_pending, name=f"cache-writer-{self.namespace}", daemon=True
+                )
+                self._writer.start()
+            self._queued.notify_all()
+
+    def _write_pending(self):
+        while True:
+            with self._queued:
+                while not self._pending:
+                    self._queued.wait()
+                self._writing = True
+            # Invalidations hold the write lock, so a batch never lands after one
+            with self._write_lock:
+                with self._queued:
+                    batch, self._pending = self._pending, OrderedDict()
+                try:
+                    self._commit(batch)
+                except sqlite3.Error as e:
+                    logger.error(f"Could not write {len(batch)} {self.namespace} cache entries: {e}")
+                finally:
+                    with self._queued:
+                        self._writing = False
+                        self._queued.notify_all()
+
+    def _commit(self, batch):
+        if not batch:
+            return
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(self.namespace, key, item[0], item[1], now) for key, item in batch.items() if item is not None]
+            )
+            conn.executemany(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                [(self.namespace, key) for key, item in batch.items() if item is None]
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        writes = self._writes + len(batch)
+        if writes // self._PRUNE_EVERY != self._writes // self._PRUNE_EVERY:
+            self._prune(conn)
+        self._writes = writes
+
+    def flush(self, timeout=30):
+        """
+        Wait until every queued change is committed.
+        """
+        with self._queued:
+            return self._queued.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def _prune(self, conn):
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+            (self.namespace, time.time())
+        )
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache WHERE namespace = ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries)
+        )
+
+    def delete_where(self, predicate):
+        """
+        Delete matching entries, queued or committed, and return their keys.
+        """
+        with self._write_lock:
+            with self._queued:
+                queued = [key for key, item in self._pending.items() if item is not None and predicate(key)]
+                for key in queued:
+                    del self._pending[key]
+            conn = self._conn()
+            keys = [key for (key,) in conn.execute("SELECT key FROM cache WHERE namespace = ?", (self.namespace,))]
+            doomed = [(self.namespace, key) for key in keys if predicate(key)]
+            conn.executemany("DELETE FROM cache WHERE namespace = ? AND key = ?", doomed)
+            self._bump_generation(conn)
+            return list(set(queued) | {key for _, key in doomed})
+
+    def clear(self):
+        with self._write_lock:
+            with self._queued:
+                self._pending.clear()
+            conn = self._conn()
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            self._bump_generation(conn)
+
+    def is_empty(self):
+        return self._conn().execute(
+            "SELECT 1 FROM cache WHERE namespace = ? LIMIT 1", (self.namespace,)
+        ).fetchone() is None
+
+    def import_entries(self, entries):
+        """
+        Bulk-load (key, value, expires_at) tuples, e.g. from a legacy JSON cache file.
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO cache (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(self.namespace, key, json.dumps(value), expires_at, now) for key, value, expires_at in entries]
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def make_store(namespace, path, max_entries=10000, legacy_filter=None):
+    """
+    Return the persistent store for a cache under the configured backend:
+    a JSON file at path, or a namespace in the shared SQLite database. The
+    first SQLite use of a namespace imports the existing JSON file so the
+    cache stays warm. Returns None when persistence is disabled (path "").
+    """
+    if not path:
+        return None
+    if CACHE_BACKEND != "sqlite":
+        return JSONFileStore(path, max_entries=max_entries, legacy_filter=legacy_filter)
+
+    store = SQLiteStore(CACHE_DB_PATH, namespace, max_entries=max_entries)
+    if os.path.exists(path):
+        try:
+            if store.is_empty():
+                legacy = JSONFileStore(path, max_entries=max_entries, legacy_filter=legacy_filter)
+                store.import_entries(
+                    (key, value, expires_at) for key, (value, expires_at) in legacy._load().items()
+                )
+                logger.info(f"Imported {path} into the shared {namespace} cache")
+        except sqlite3.Error as e:
+            logger.error(f"Could not import {path} into the shared {namespace} cache: {e}")
+    return store
+
+
+def flush_stores():
+    """
+    Write every store's pending changes, e.g. at shutdown.
+    """
+    for store in list(_buffered_stores):
+        store.flush()
+
+
+atexit.register(flush_stores)
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory LRU cache with per-entry TTL, optionally backed by a
+    persistent store that is consulted on a memory miss. With a shared store
+    the memory tier is dropped whenever another process invalidates entries,
+    which is checked at most once a second.
+    """
+
+    _GENERATION_CHECK_SECONDS = 1.0
+
+    def __init__(self, name, maxsize=1024, ttl=None, store=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._generation = None
+        self._generation_checked_at = None
+        self._lock = threading.RLock()
+        _caches.add(self)
+
+    def _check_generation(self):
+        # Called with self._lock held
+        if self.store is None or not self.store.shared:
+            return
+        now = time.monotonic()
+        if self._generation_checked_at is not None and now - self._generation_checked_at < self._GENERATION_CHECK_SECONDS:
+            return
+        self._generation_checked_at = now
+        try:
+            generation = self.store.generation()
+        except sqlite3.Error as e:
+            logger.error(f"Could not read {self.name} cache generation: {e}")
+            return
+        if generation != self._generation:
+            if self._generation is not None:
+                self._data.clear()
+            self._generation = generation
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            self._check_generation()
+            item = self._data.get(key)
+            if item is None and self.store is not None:
+                try:
+                    item = self.store.get(key)
+                except sqlite3.Error as e:
+                    logger.error(f"Could not read {self.name} cache entry: {e}")
+                if item is not None:
+                    self._data[key] = item
+            if item is not None:
+                value, expires_at = item
+                if expires_at is None or expires_at > now:
+                    self._data.move_to_end(key)
+                    self._evict()
+                    self.hits += 1
+                    return value
+                self._drop(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=_MISSING):
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires_at)
+            self._evict()
+            if self.store is not None:
+                try:
+                    self.store.set(key, value, expires_at)
+                except (OSError, sqlite3.Error) as e:
+                    logger.error(f"Could not persist {self.name} cache entry: {e}")
+
+    def delete(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def publish(self):
+        """
+        Wait until writes to a shared store are visible to other processes.
+        """
+        if self.store is not None and self.store.shared:
+            self.store.flush()
+
+    def delete_where(self, predicate):
+        """
+        Remove every entry whose key matches predicate, in memory and in the store.
+        Returns the number of distinct entries removed from either.
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            if self.store is not None:
+                keys = set(keys).union(self.store.delete_where(predicate))
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            if self.store is not None:
+                self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+    def _drop(self, key):
+        self._data.pop(key, None)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def _evict(self):
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+def all_caches():
+    """
+    Return every live TTLCache in the process.
+    """
+    return list(_caches)
@@ -1,99 +1,234 @@
 import re
-import time
+import asyncio
 import logging
-import requests
-from urllib.parse import urlparse, parse_qs
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-import os
+from urllib.parse import urlparse, parse_qs, urljoin
 
-from app.config import GOOGLE_API_KEY
+from app.config import (
+    GOOGLE_API_KEY,
+    GEOCODING_PROVIDER,
+    SHARED_LOCK_DIR,
+    GEOCODE_CACHE_PATH,
+    GEOCODE_CACHE_TTL_SECONDS,
+    GEOCODE_CACHE_MAX_ENTRIES,
+    REVERSE_GEOCODE_CACHE_PATH,
+    REVERSE_GEOCODE_CACHE_TTL_SECONDS,
+    REVERSE_GEOCODE_CACHE_MAX_ENTRIES,
+    REVERSE_GEOCODE_GEOHASH_PRECISION,
+    DIRECTIONS_CACHE_PATH,
+    DIRECTIONS_CACHE_TTL_SECONDS,
+    DIRECTIONS_CACHE_MAX_ENTRIES,
+    DIRECTIONS_CACHE_BUCKET_MINUTES,
+    DISTANCE_MATRIX_MAX_ORIGINS,
+    DISTANCE_MATRIX_MAX_DESTINATIONS,
+    DISTANCE_MATRIX_MAX_ELEMENTS,
+    MAX_REDIRECT_HOPS
+)
+from app.utils import http
+from app.utils.cache import TTLCache, make_store
+from app.utils.http import on_http_loop
+from app.utils.singleflight import SingleFlight
+from app.utils.metrics import upstream_requests, upstream_seconds
+from app.utils.tracing import span, traced, annotate
+from app.utils.governor import (
+    google_governor,
+    RetryableError,
+    CircuitOpenError,
+    RETRYABLE_HTTP_STATUSES,
+    RETRYABLE_API_STATUSES
+)
 
 # Set up logging
 logger = logging.getLogger("app.geo")
 
-# def unshorten_url(short_url, retries=3, delay=2, wait_time=5):
-#     """
-#     Uses a headless browser to fully load a short Google Maps URL
-#     and extract the final, fully updated URL with accurate coordinates.
-#     """
-#     for attempt in range(retries):
-#         try:
-#             logger.debug(f"Attempt {attempt + 1}: Trying to unshorten URL via Selenium: {short_url}")
+# Bare "coords_<url>" entries in the legacy cache file were produced by an older
+# extraction order (view before place coordinates), so only the short-link ->
+# expanded-URL entries are carried over; coordinates are re-derived locally.
+geocode_cache = TTLCache(
+    "geocode",
+    maxsize=GEOCODE_CACHE_MAX_ENTRIES,
+    ttl=GEOCODE_CACHE_TTL_SECONDS,
+    store=make_store(
+        "geocode",
+        GEOCODE_CACHE_PATH,
+        max_entries=GEOCODE_CACHE_MAX_ENTRIES,
+        legacy_filter=lambda key: not key.startswith("coords_")
+    )
+)
 
-#             options = webdriver.ChromeOptions()
-#             options.add_argument("--headless")
-#             options.add_argument("--disable-notifications")
-#             options.add_argument("--disable-gpu")
-#             options.add_argument("--no-sandbox")
+# Addresses only change every few tens of metres, so reverse geocoding results
+# are cached per geohash cell rather than per exact coordinate pair.
+reverse_geocode_cache = TTLCache(
+    "reverse_geocode",
+    maxsize=REVERSE_GEOCODE_CACHE_MAX_ENTRIES,
+    ttl=REVERSE_GEOCODE_CACHE_TTL_SECONDS,
+    store=make_store(
+        "reverse_geocode",
+        REVERSE_GEOCODE_CACHE_PATH,
+        max_entries=REVERSE_GEOCODE_CACHE_MAX_ENTRIES
+    )
+)
 
-#             options.add_argument("--disable-dev-shm-usage")
-#             options.add_argument(f"--user-data-dir=/tmp/chrome-user-data-{os.getpid()}")
-#             options.add_argument("--remote-debugging-port=9222")
+# Directions legs keyed by (origin, destination, mode, avoid, time-of-day bucket)
+directions_cache = TTLCache(
+    "directions",
+    maxsize=DIRECTIONS_CACHE_MAX_ENTRIES,
+    ttl=DIRECTIONS_CACHE_TTL_SECONDS,
+    store=make_store(
+        "directions",
+        DIRECTIONS_CACHE_PATH,
+        max_entries=DIRECTIONS_CACHE_MAX_ENTRIES
+    )
+)
 
-#             service = webdriver.ChromeService(
-#                 executable_path="/usr/local/bin/chromedriver",
-#                 log_path="/tmp/chromedriver.log",
-#                 service_args=["--verbose"]
-#             )
+# Failures worth retrying: throttling/5xx answers and network-level errors
+RETRY_ON = (RetryableError, http.TransportError)
 
-#             driver = webdriver.Chrome(options=options, service=service)
-#             driver.get(short_url)
+async def google_get(endpoint, url, params=None):
+    """
+    GET a Google Maps web service URL under the shared governor (QPS budget,
+    retries with backoff, circuit breaker) and return the decoded JSON.
+    """
+    async def attempt():
+        with span(f"google.{endpoint}") as call:
+            try:
+                with upstream_seconds.time(endpoint=endpoint):
+                    response = await http.get(url, params=params)
+            except http.TransportError:
+                upstream_requests.inc(endpoint=endpoint, status="transport_error")
+                raise
+            call.set_attribute("http.status_code", response.status_code)
+            if response.status_code != 200:
+                upstream_requests.inc(endpoint=endpoint, status=str(response.status_code))
+            if response.status_code in RETRYABLE_HTTP_STATUSES:
+                raise RetryableError(f"HTTP {response.status_code}")
+            data = response.json()
+            call.set_attribute("api.status", data.get("status", "OK"))
+            if response.status_code == 200:
+                upstream_requests.inc(endpoint=endpoint, status=data.get("status", "OK"))
+            if data.get("status") in RETRYABLE_API_STATUSES:
+                raise RetryableError(data.get("error_message") or data["status"])
+            return data
 
-#             time.sleep(wait_time)  # Wait for page to load and URL to update
+    return await google_governor.call(endpoint, attempt, retry_on=RETRY_ON)
 
-#             final_url = driver.current_url
-#             logger.debug(f"Selenium unshortened URL: {final_url}")
-#             driver.quit()
+def _cached_coordinates(cache_key):
+    cached = geocode_cache.get(cache_key)
+    return tuple(cached) if cached else None
 
-#             return final_url
+# Concurrent identical lookups share one in-flight fetch; with SHARED_LOCK_DIR
+# set this also holds across worker processes sharing the cache database
+coordinates_flight = SingleFlight(
+    "coordinates", lock_dir=SHARED_LOCK_DIR, lookup=_cached_coordinates, publish=geocode_cache.publish
+)
+reverse_geocode_flight = SingleFlight(
+    "reverse_geocode", lock_dir=SHARED_LOCK_DIR, lookup=reverse_geocode_cache.get, publish=reverse_geocode_cache.publish
+)
+directions_flight = SingleFlight(
+    "directions", lock_dir=SHARED_LOCK_DIR, lookup=directions_cache.get, publish=directions_cache.publish
+)
 
-#         except Exception as e:
-#             logger.error(f"[Attempt {attempt + 1}] Selenium failed to unshorten URL: {e}")
-#             time.sleep(delay)
+def flight_stats():
+    """
+    Executed vs. coalesced call counts for each geo lookup.
+    """
+    return [flight.stats() for flight in (coordinates_flight, reverse_geocode_flight, directions_flight)]
 
-#     return None
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
 
-def unshorten_url(short_url, retries=3, delay=2):
+def geohash_encode(lat, lng, precision=REVERSE_GEOCODE_GEOHASH_PRECISION):
+    """
+    Encode coordinates as a geohash string of the given length.
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+@on_http_loop
+@traced("unshorten_url")
+async def unshorten_url_async(short_url, retries=3, delay=2):
     """
-    Uses requests to follow redirects and get the final URL
-    instead of using Selenium for better compatibility with Cloud Run.
-    """
-    for attempt in range(retries):
-        try:
-            logger.debug(f"Attempt {attempt + 1}: Trying to unshorten URL via requests: {short_url}")
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'none',
-                'Sec-Fetch-User': '?1',
-                'Cache-Control': 'max-age=0',
-            }
-            
-            response = requests.get(
-                short_url, 
-                headers=headers, 
-                allow_redirects=True,
-                timeout=10
+    Resolves a short Google Maps link by following Location headers hop by
+    hop without downloading any page body, stopping as soon as a hop's URL
+    carries coordinates. Every hop is cached against the resolved URL.
+    """
+    cached = geocode_cache.get(short_url)
+    annotate(cache="hit" if cached else "miss")
+    if cached:
+        logger.debug(f"Cached unshortened URL for {short_url}: {cached}")
+        return cached
+
+    headers = {"User-Agent": "Mozilla/5.0 (compatible; route-planner)"}
+
+    async def next_hop(url):
+        with span("google.unshorten", url=url) as call:
+            try:
+                with upstream_seconds.time(endpoint="unshorten"):
+                    status, location = await http.fetch_redirect(url, headers=headers)
+            except http.TransportError:
+                upstream_requests.inc(endpoint="unshorten", status="transport_error")
+                raise
+            call.set_attribute("http.status_code", status)
+        upstream_requests.inc(endpoint="unshorten", status=str(status))
+        if status in RETRYABLE_HTTP_STATUSES:
+            raise RetryableError(f"HTTP {status}")
+        return location if status in REDIRECT_STATUSES else None
+
+    url = short_url
+    hops = []
+    try:
+        for _ in range(MAX_REDIRECT_HOPS):
+            if hops:
+                cached = geocode_cache.get(url)
+                if cached:
+                    url = cached
+                    break
+                if isinstance(extract_coordinates_or_query(url), tuple):
+                    break
+            location = await google_governor.call(
+                "unshorten", next_hop, url, retry_on=RETRY_ON, max_attempts=retries, backoff_base=delay
             )
-            
-            final_url = response.url
-            logger.debug(f"Requests unshortened URL: {final_url}")
-            
-            return final_url
+            if not location:
+                break
+            hops.append(url)
+            url = urljoin(url, location)
+            logger.debug(f"Redirect hop {len(hops)}: {url}")
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"HTTP failed to unshorten URL: {e}")
+        return None
 
-        except Exception as e:
-            logger.error(f"[Attempt {attempt + 1}] Requests failed to unshorten URL: {e}")
-            time.sleep(delay)
+    logger.debug(f"HTTP unshortened URL: {url} after {len(hops)} hops")
+    for hop in hops or [short_url]:
+        geocode_cache.set(hop, url)
+    return url
 
-    return None
+def unshorten_url(short_url, retries=3, delay=2):
+    """
+    Synchronous wrapper around unshorten_url_async.
+    """
+    return http.run_sync(unshorten_url_async(short_url, retries, delay))
 
 def extract_coordinates_or_query(full_url):
     """
@@ -135,41 +270,104 @@ def extract_coordinates_or_query(full_url):
 
     return None
 
-def get_coordinates_from_place(place, api_key):
+@on_http_loop
+@traced("get_coordinates_from_place")
+async def get_coordinates_from_place_async(place, api_key):
     """
     Convert a place name to coordinates using Google Geocoding API.
     """
     logger.debug(f"Getting coordinates for place: {place}")
+    cache_key = f"place_{place}"
+    cached = geocode_cache.get(cache_key)
+    annotate(cache="hit" if cached else "miss")
+    if cached:
+        return tuple(cached)
+    if GEOCODING_PROVIDER != "google":
+        logger.warning(f"Place lookups need GEOCODING_PROVIDER=google, cannot locate: {place}")
+        return None
+
     endpoint = "https://maps.googleapis.com/maps/api/geocode/json"
     params = {"address": place, "key": api_key}
-    response = requests.get(endpoint, params=params)
-    data = response.json()
+    data = await google_get("geocode", endpoint, params=params)
     if data['results']:
         location = data['results'][0]['geometry']['location']
         logger.debug(f"Coordinates for place '{place}': {location['lat']}, {location['lng']}")
+        geocode_cache.set(cache_key, [location['lat'], location['lng']])
         return location['lat'], location['lng']
     logger.warning(f"Could not get coordinates for place: {place}")
     return None
 
-def reverse_geocode(lat, lng, api_key=GOOGLE_API_KEY):
+def get_coordinates_from_place(place, api_key):
+    """
+    Synchronous wrapper around get_coordinates_from_place_async.
+    """
+    return http.run_sync(get_coordinates_from_place_async(place, api_key))
+
+@on_http_loop
+@traced("reverse_geocode")
+async def reverse_geocode_async(lat, lng, api_key=GOOGLE_API_KEY):
     """
     Convert coordinates to an address using Google Reverse Geocoding API.
     """
     logger.debug(f"Getting address for coordinates: {lat}, {lng}")
+    cell = geohash_encode(lat, lng)
+    cached = reverse_geocode_cache.get(cell)
+    annotate(cache="hit" if cached else "miss")
+    if cached:
+        logger.debug(f"Cached address for cell {cell}: {cached}")
+        return cached
+    if GEOCODING_PROVIDER != "google":
+        return "Unknown location"
+
+    return await reverse_geocode_flight.do_async(cell, _fetch_address, lat, lng, api_key, cell)
+
+async def _fetch_address(lat, lng, api_key, cell):
     url = f"https://maps.googleapis.com/maps/api/geocode/json?latlng={lat},{lng}&key={api_key}"
-    response = requests.get(url)
-    data = response.json()
+    data = await google_get("geocode", url)
     if data['results']:
         logger.debug(f"Address for coordinates: {data['results'][0]['formatted_address']}")
+        reverse_geocode_cache.set(cell, data['results'][0]['formatted_address'])
         return data['results'][0]['formatted_address']
     logger.warning("Could not reverse geocode coordinates.")
     return "Unknown location"
 
-def get_coordinates(url, api_key=GOOGLE_API_KEY):
+def reverse_geocode(lat, lng, api_key=GOOGLE_API_KEY):
+    """
+    Synchronous wrapper around reverse_geocode_async.
+    """
+    return http.run_sync(reverse_geocode_async(lat, lng, api_key))
+
+@on_http_loop
+@traced("get_coordinates")
+async def get_coordinates_async(url, api_key=GOOGLE_API_KEY):
     """
     Extract coordinates from a Google Maps URL.
     """
     logger.debug(f"Getting coordinates from URL: {url}")
+    cache_key = f"coords_{url}"
+    cached = geocode_cache.get(cache_key)
+    annotate(cache="hit" if cached else "miss")
+    if cached:
+        logger.debug(f"Cached coordinates for URL: {cached}")
+        return tuple(cached)
+
+    return await coordinates_flight.do_async(cache_key, _fetch_coordinates, url, api_key, cache_key)
+
+async def _fetch_coordinates(url, api_key, cache_key):
+    coords = await _resolve_coordinates(url, api_key)
+    geocode_cache.set(cache_key, list(coords))
+    return coords
+
+def get_coordinates(url, api_key=GOOGLE_API_KEY):
+    """
+    Synchronous wrapper around get_coordinates_async.
+    """
+    return http.run_sync(get_coordinates_async(url, api_key))
+
+async def _resolve_coordinates(url, api_key):
+    """
+    Resolve a Google Maps URL to coordinates, bypassing the coordinates cache.
+    """
     # If it's a Google Maps URL, directly extract the coordinates or query
     if url.startswith("https://www.google.com/maps?q="):
         info = extract_coordinates_or_query(url)
@@ -177,12 +375,12 @@ def get_coordinates(url, api_key=GOOGLE_API_KEY):
             logger.debug(f"Direct coordinates extracted from Google Maps URL: {info}")
             return info
         elif isinstance(info, str):  # Place name
-            coords = get_coordinates_from_place(info, api_key)
+            coords = await get_coordinates_from_place_async(info, api_key)
             if coords:
                 return coords
     else:
         # Otherwise, unshorten the URL first
-        real_url = unshorten_url(url)
+        real_url = await unshorten_url_async(url)
         if not real_url:
             raise Exception("Could not unshorten URL.")
         
@@ -192,61 +390,199 @@ def get_coordinates(url, api_key=GOOGLE_API_KEY):
         if isinstance(info, tuple):  # Direct coordinates
             return info
         elif isinstance(info, str):  # Place name
-            coords = get_coordinates_from_place(info, api_key)
+            coords = await get_coordinates_from_place_async(info, api_key)
             if coords:
                 return coords
     
     raise Exception("Could not extract coordinates.")
 
-def get_directions(start, end, api_key=GOOGLE_API_KEY):
+def _point_key(point):
+    return f"{point[0]},{point[1]}"
+
+def departure_bucket(departure_time=None):
+    """
+    Return the time-of-day bucket index for a departure time. Without one
+    the request is not time dependent, so every call shares one bucket.
+    """
+    if departure_time is None:
+        return "any"
+    minute_of_day = departure_time.hour * 60 + departure_time.minute
+    return minute_of_day // DIRECTIONS_CACHE_BUCKET_MINUTES
+
+def directions_cache_key(start, end, mode, avoid, bucket):
+    return f"{_point_key(start)}|{_point_key(end)}|{mode}|{avoid}|{bucket}"
+
+def invalidate_directions(start=None, end=None):
+    """
+    Drop cached directions legs. With no arguments the whole cache is cleared;
+    otherwise only legs from start and/or to end are removed (all buckets).
+    """
+    if start is None and end is None:
+        directions_cache.clear()
+        return
+    origin = _point_key(start) if start is not None else None
+    destination = _point_key(end) if end is not None else None
+
+    def matches(key):
+        key_origin, key_destination = key.split("|")[:2]
+        return (origin is None or key_origin == origin) and (destination is None or key_destination == destination)
+
+    removed = directions_cache.delete_where(matches)
+    logger.debug(f"Invalidated {removed} cached directions legs")
+
+def build_leg(start, end, leg, mode="driving"):
+    """
+    Build the leg dict used by the scheduler from a Directions leg or a
+    Distance Matrix element (both carry duration and distance values).
+    """
+    # Extract original duration in seconds
+    original_seconds = leg["duration"]["value"]
+    adjusted_seconds = original_seconds
+    adjusted_minutes = adjusted_seconds // 60
+    adjusted_text = f"{adjusted_minutes} mins"
+
+    # Extract distance in kilometers
+    distance_text = leg["distance"]["text"]
+    distance_value = leg["distance"]["value"] / 1000  # Convert meters to kilometers
+
+    # Format time as HH:MM
+    hours = adjusted_minutes // 60
+    mins = adjusted_minutes % 60
+    time_format = f"{hours:02d}:{mins:02d}"
+
+    logger.debug(f"Original duration: {original_seconds}s, Adjusted: {adjusted_seconds}s, Distance: {distance_text}")
+
+    return {
+        "distance": distance_text,
+        "distance_km": round(distance_value, 1),  # Round to 1 decimal place
+        "duration": adjusted_text,
+        "duration_seconds": adjusted_seconds,
+        "time_format": time_format,
+        "route_url": f"https://www.google.com/maps/dir/?api=1&origin={start[0]},{start[1]}&destination={end[0]},{end[1]}&travelmode={mode}"
+    }
+
+@on_http_loop
+@traced("get_directions")
+async def get_directions_async(start, end, api_key=GOOGLE_API_KEY, mode="driving", avoid="tolls|ferries", departure_time=None):
     """
     Get directions between two points using Google Directions API.
+    Legs are cached per departure-time bucket; departure_time only selects
+    the bucket, and legs without one share a single bucket.
     """
     logger.debug(f"Getting directions from {start} to {end}")
+    cache_key = directions_cache_key(start, end, mode, avoid, departure_bucket(departure_time))
+    cached = directions_cache.get(cache_key)
+    annotate(cache="hit" if cached else "miss")
+    if cached:
+        logger.debug(f"Cached directions from {start} to {end}")
+        return dict(cached)
+
+    leg_info = await directions_flight.do_async(
+        cache_key, _fetch_directions, start, end, api_key, mode, avoid, cache_key
+    )
+    return dict(leg_info)
+
+async def _fetch_directions(start, end, api_key, mode, avoid, cache_key):
     endpoint = "https://maps.googleapis.com/maps/api/directions/json"
     params = {
         "origin": f"{start[0]},{start[1]}",
         "destination": f"{end[0]},{end[1]}",
-        "mode": "driving",
-        "avoid": "tolls|ferries",
+        "mode": mode,
+        "avoid": avoid,
         "key": api_key
     }
     try:
-        response = requests.get(endpoint, params=params)
-        data = response.json()
+        data = await google_get("directions", endpoint, params=params)
 
         if data.get("routes"):
-            leg = data["routes"][0]["legs"][0]
-            
-            # Extract original duration in seconds
-            original_seconds = leg["duration"]["value"]
-            adjusted_seconds = original_seconds
-            adjusted_minutes = adjusted_seconds // 60
-            adjusted_text = f"{adjusted_minutes} mins"
-
-            # Extract distance in kilometers
-            distance_text = leg["distance"]["text"]
-            distance_value = leg["distance"]["value"] / 1000  # Convert meters to kilometers
-            
-            # Format time as HH:MM
-            hours = adjusted_minutes // 60
-            mins = adjusted_minutes % 60
-            time_format = f"{hours:02d}:{mins:02d}"
-
-            logger.debug(f"Original duration: {original_seconds}s, Adjusted: {adjusted_seconds}s, Distance: {distance_text}")
-            
-            return {
-                "distance": distance_text,
-                "distance_km": round(distance_value, 1),  # Round to 1 decimal place
-                "duration": adjusted_text,
-                "duration_seconds": adjusted_seconds,
-                "time_format": time_format,
-                "route_url": f"https://www.google.com/maps/dir/?api=1&origin={start[0]},{start[1]}&destination={end[0]},{end[1]}&travelmode=driving"
-            }
+            leg_info = build_leg(start, end, data["routes"][0]["legs"][0], mode)
+            directions_cache.set(cache_key, leg_info)
+            return leg_info
         else:
             error_message = data.get("error_message", "Unknown error")
             logger.error(f"Error from Google Directions API: {error_message}")
             raise Exception(f"Directions API error: {error_message}")
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Could not get directions: {str(e)}")
-        raise Exception(f"Could not get directions: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Could not get directions: {str(e)}")
+
+def get_directions(start, end, api_key=GOOGLE_API_KEY, mode="driving", avoid="tolls|ferries", departure_time=None):
+    """
+    Synchronous wrapper around get_directions_async.
+    """
+    return http.run_sync(get_directions_async(start, end, api_key, mode, avoid, departure_time))
+
+def _matrix_requests(pairs):
+    """
+    Group (origin, destination) pairs into Distance Matrix requests that
+    respect the per-request origin, destination and element limits.
+    Origins needing the same destinations share a request.
+    """
+    destinations_by_origin = {}
+    for origin, destination in pairs:
+        destinations_by_origin.setdefault(origin, []).append(destination)
+
+    origins_by_destinations = {}
+    for origin, destinations in destinations_by_origin.items():
+        origins_by_destinations.setdefault(tuple(dict.fromkeys(destinations)), []).append(origin)
+
+    batches = []
+    for destinations, origins in origins_by_destinations.items():
+        dest_step = min(len(destinations), DISTANCE_MATRIX_MAX_DESTINATIONS, DISTANCE_MATRIX_MAX_ELEMENTS)
+        for d in range(0, len(destinations), dest_step):
+            dest_chunk = destinations[d:d + dest_step]
+            origin_step = min(DISTANCE_MATRIX_MAX_ORIGINS, DISTANCE_MATRIX_MAX_ELEMENTS // len(dest_chunk))
+            for o in range(0, len(origins), origin_step):
+                batches.append((origins[o:o + origin_step], dest_chunk))
+    return batches
+
+@on_http_loop
+@traced("get_leg_matrix")
+async def get_leg_matrix_async(pairs, api_key=GOOGLE_API_KEY, mode="driving", avoid="tolls|ferries", departure_time=None):
+    """
+    Resolve many (origin, destination) legs with as few Distance Matrix
+    requests as the element limits allow. Cached legs are reused and fresh
+    ones are written to the directions cache. Returns {pair: leg dict};
+    pairs the matrix could not answer are left out for Directions fallback.
+    """
+    bucket = departure_bucket(departure_time)
+    legs = {}
+    missing = []
+    for origin, destination in dict.fromkeys(pairs):
+        cached = directions_cache.get(directions_cache_key(origin, destination, mode, avoid, bucket))
+        if cached:
+            legs[(origin, destination)] = dict(cached)
+        else:
+            missing.append((origin, destination))
+
+    missing_set = set(missing)
+    batches = _matrix_requests(missing)
+    logger.debug(f"Fetching {len(missing)} legs in {len(batches)} Distance Matrix requests")
+
+    async def fetch(origins, destinations):
+        params = {
+            "origins": "|".join(_point_key(o) for o in origins),
+            "destinations": "|".join(_point_key(d) for d in destinations),
+            "mode": mode,
+            "avoid": avoid,
+            "key": api_key
+        }
+        data = await google_get("distancematrix", "https://maps.googleapis.com/maps/api/distancematrix/json", params=params)
+        if data.get("status") != "OK":
+            logger.error(f"Error from Google Distance Matrix API: {data.get('error_message', data.get('status'))}")
+            return
+        for origin, row in zip(origins, data["rows"]):
+            for destination, element in zip(destinations, row["elements"]):
+                if (origin, destination) not in missing_set or element.get("status") != "OK":
+                    continue
+                leg_info = build_leg(origin, destination, element, mode)
+                directions_cache.set(directions_cache_key(origin, destination, mode, avoid, bucket), leg_info)
+                legs[(origin, destination)] = dict(leg_info)
+
+    results = await asyncio.gather(*(fetch(o, d) for o, d in batches), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Distance Matrix request failed: {result}")
+    return legs
@@ -1,250 +1,336 @@
-from datetime import datetime, timedelta
-import gspread
-
-# Load service account and sheet
-gc = gspread.service_account(filename="sheets.json")
-sh = gc.open_by_url("https://docs.google.com/spreadsheets/d/12-NJ-M4DpgCKU5h1Tg4Zj7qhRdQO5vzuUFRDMiVLDk0/edit#gid=0")
+import os
+import time
+import logging
+import threading
+
+from app.config import SHEETS_CREDENTIALS_PATH, SPREADSHEET_URL, SHEETS_API_QPS, SHEETS_API_BURST, GOOGLE_API_MAX_ATTEMPTS
+from app.utils.governor import make_bucket, backoff_delay
+from app.utils.metrics import upstream_requests, upstream_seconds, upstream_retries
+from app.utils.tracing import record_span
+
+logger = logging.getLogger("app.google_sheets")
+
+# Header banner shared by every section: blue background, white bold text, centred
+HEADER_FORMAT = {
+    "textFormat": {"bold": True, "foregroundColor": {"red": 1.0, "green": 1.0, "blue": 1.0}},
+    "backgroundColor": {"red": 20/255, "green": 95/255, "blue": 130/255},
+    "horizontalAlignment": "CENTER",
+    "verticalAlignment": "MIDDLE"
+}
+
+# Section banners are merged across columns A:I
+BANNER_COLUMNS = 9
+
+# Quota exhaustion and transient backend errors worth another attempt
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# addSheet attempts when another writer takes a title first
+WORKSHEET_CREATE_ATTEMPTS = 3
+
+# Sheets allows about 60 write requests per minute per user; every process
+# shares this budget when RATE_LIMIT_BACKEND is sqlite
+_sheets_bucket = make_bucket("sheets", SHEETS_API_QPS, SHEETS_API_BURST)
+
+# The service account and spreadsheet are opened on first use, not at import,
+# so the app starts offline and without sheets.json
+_client = None
+_spreadsheet = None
+_init_lock = threading.Lock()
+
+
+def _record_response(response, *args, **kwargs):
+    # Count and trace every Sheets API round trip (gspread 6 keeps its session on http_client)
+    elapsed = response.elapsed.total_seconds()
+    upstream_requests.inc(endpoint="sheets", status=str(response.status_code))
+    upstream_seconds.observe(elapsed, endpoint="sheets")
+    record_span(
+        "gspread", elapsed,
+        method=response.request.method, url=response.request.url, status=response.status_code
+    )
+
+
+def get_client():
+    """
+    Return the authorised gspread client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                import gspread
+
+                client = gspread.service_account(filename=SHEETS_CREDENTIALS_PATH)
+                session = getattr(getattr(client, "http_client", None), "session", None) or getattr(client, "session", None)
+                if session is not None:
+                    session.hooks["response"].append(_record_response)
+                _client = client
+    return _client
+
+
+def get_spreadsheet():
+    """
+    Return the output spreadsheet, opening it on first use.
+    """
+    global _spreadsheet
+    if _spreadsheet is None:
+        client = get_client()
+        with _init_lock:
+            if _spreadsheet is None:
+                _spreadsheet = client.open_by_url(SPREADSHEET_URL)
+    return _spreadsheet
+
+
+def credentials_available():
+    """
+    True if the service account file exists; never contacts Google.
+    """
+    return _client is not None or os.path.isfile(SHEETS_CREDENTIALS_PATH)
+
+
+def sheets_call(func, *args, **kwargs):
+    """
+    Call the Sheets API within the SHEETS_API_QPS budget, retrying quota
+    (429) and transient server errors with jittered backoff.
+    """
+    for attempt in range(1, GOOGLE_API_MAX_ATTEMPTS + 1):
+        _sheets_bucket.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if status not in RETRYABLE_STATUSES or attempt == GOOGLE_API_MAX_ATTEMPTS:
+                raise
+            delay = backoff_delay(attempt)
+            upstream_retries.inc(endpoint="sheets")
+            logger.warning(f"Sheets API returned {status}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class WorksheetIndex:
+    """
+    Worksheet titles of one output, read once through load() and then kept
+    current from our own additions, plus the next " (n)" suffix to try for
+    each base name so allocation does not rescan the titles.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self._titles = None
+        self._next_suffix = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """
+        Drop the index so the next allocation reloads the titles.
+        """
+        with self._lock:
+            self._titles = None
+
+    def allocate(self, base_names):
+        """
+        Reserve a unique title for each base name: the name itself if free,
+        else "name (n)" with the lowest free n, as worksheets were named before.
+        """
+        with self._lock:
+            if self._titles is None:
+                self._titles = set(self.load())
+                self._next_suffix = {}
+            titles = []
+            for base_name in base_names:
+                title = base_name
+                if title in self._titles:
+                    counter = self._next_suffix.get(base_name, 1)
+                    while f"{base_name} ({counter})" in self._titles:
+                        counter += 1
+                    title = f"{base_name} ({counter})"
+                    self._next_suffix[base_name] = counter + 1
+                self._titles.add(title)
+                titles.append(title)
+            return titles
+
+
+def _spreadsheet_titles():
+    metadata = sheets_call(get_spreadsheet().fetch_sheet_metadata, {"includeGridData": "false", "fields": "sheets.properties.title"})
+    return [sheet["properties"]["title"] for sheet in metadata.get("sheets", [])]
+
+
+worksheet_index = WorksheetIndex(_spreadsheet_titles)
+
+
+def _worksheet(sh, properties):
+    import gspread
+
+    try:
+        return gspread.Worksheet(sh, properties, sh.id, sh.client)  # gspread 6
+    except TypeError:
+        return gspread.Worksheet(sh, properties)
+
+
+def create_worksheets(base_names, rows=100, cols=20):
+    """
+    Add one uniquely named worksheet per base name with a single addSheet
+    batch. If another writer took a title first, reload the index and retry.
+    """
+    sh = get_spreadsheet()
+    for attempt in range(1, WORKSHEET_CREATE_ATTEMPTS + 1):
+        titles = worksheet_index.allocate(base_names)
+        body = {"requests": [
+            {"addSheet": {"properties": {"title": title, "gridProperties": {"rowCount": rows, "columnCount": cols}}}}
+            for title in titles
+        ]}
+        try:
+            response = sheets_call(sh.batch_update, body)
+        except Exception as e:
+            # The batch is atomic, but our view of the titles may be stale
+            worksheet_index.invalidate()
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if status != 400 or attempt == WORKSHEET_CREATE_ATTEMPTS:
+                raise
+            logger.warning(f"Could not add worksheets {titles}, reloading titles: {e}")
+            continue
+        return [_worksheet(sh, reply["addSheet"]["properties"]) for reply in response["replies"]]
 
 
 def get_or_create_unique_worksheet(base_name):
-    existing_titles = [ws.title for ws in sh.worksheets()]
-    
-    if base_name not in existing_titles:
-        return sh.add_worksheet(title=base_name, rows="100", cols="20")
-
-    # If exists, create new with a suffix
-    counter = 1
-    new_name = f"{base_name} ({counter})"
-    while new_name in existing_titles:
-        counter += 1
-        new_name = f"{base_name} ({counter})"
-    return sh.add_worksheet(title=new_name, rows="100", cols="20")
-
-
-def find_next_empty_row(sheet):
-    values = sheet.get_all_values()
-    for idx in range(len(values) - 1, -1, -1):
-        if any(cell.strip() != "" for cell in values[idx][:6]):  # Check columns A–F
-            return idx + 2  # Next row after last non-empty + 1 empty row buffer
-    return 1  # Sheet is entirely empty
-
-
-def write_locations_section(sheet, start_location, dump_location, pit_result, package):
-    start_row = find_next_empty_row(sheet)
-
-    # Add the title header - Send as nested list structure as required by Sheets API
-    sheet.update(f"A{start_row}", [["LOCATIONS: START OF DAY, LOAD SITE, DUMP SITE, END OF DAY"]])
-    
-    # Merge cells A to I in the header row
-    sheet.merge_cells(f"A{start_row}:I{start_row}")
-    
-    # Apply formatting - blue background, white text, bold, and center aligned
-    sheet.format(f"A{start_row}:I{start_row}", {
-        "textFormat": {"bold": True, "foregroundColor": {"red": 1.0, "green": 1.0, "blue": 1.0}},
-        "backgroundColor": {"red": 20/255, "green": 95/255, "blue": 130/255},
-        "horizontalAlignment": "CENTER",
-        "verticalAlignment": "MIDDLE"
-    })
-
-    # Add sub-headers - Keep as nested list
-    headers = [["Location", "Activity", "LAT/LONG", "Location: Google Map Link"]]
-    sheet.update(f"A{start_row+1}:D{start_row+1}", headers)
-    sheet.format(f"A{start_row+1}:D{start_row+1}", {"textFormat": {"bold": True}})
-
-    # Add the data rows (unchanged)
-    rows = [
-        [start_location["address"], "Start of Day", f'{start_location["latitude"]}, {start_location["longitude"]}', f'https://www.google.com/maps?q={start_location["latitude"]},{start_location["longitude"]}'],
-        [start_location["address"], "End of Day", f'{start_location["latitude"]}, {start_location["longitude"]}', f'https://www.google.com/maps?q={start_location["latitude"]},{start_location["longitude"]}'],
-        [package if package else dump_location["address"], "Dumping", f'{dump_location["latitude"]}, {dump_location["longitude"]}', f'https://www.google.com/maps?q={dump_location["latitude"]},{dump_location["longitude"]}'],
-        ["Primary Pit", "Loading", f'{pit_result["latitude"]}, {pit_result["longitude"]}', f'https://www.google.com/maps?q={pit_result["latitude"]},{pit_result["longitude"]}']
-    ]
-    sheet.update(f"A{start_row+2}:D{start_row+5}", rows)
-
-
-def write_distance_section(sheet, start_location, dump_location, pit_result):
-    start_row = find_next_empty_row(sheet)
-
-    # Add the title header and apply formatting - Keep as nested list
-    sheet.update(f"A{start_row}", [["DISTANCE/SPEED/TIME TRAVELLED DOMESTIC VEHICLE"]])
-    
-    # Merge cells A to I in the header row
-    sheet.merge_cells(f"A{start_row}:I{start_row}")
-    
-    # Apply formatting - blue background, white text, bold, and center aligned
-    sheet.format(f"A{start_row}:I{start_row}", {
-        "textFormat": {"bold": True, "foregroundColor": {"red": 1.0, "green": 1.0, "blue": 1.0}},
-        "backgroundColor": {"red": 20/255, "green": 95/255, "blue": 130/255},
-        "horizontalAlignment": "CENTER",
-        "verticalAlignment": "MIDDLE"
-    })
-
-    # Add sub-headers - Keep as nested list
-    headers = [["", "", "", "Distance (km)", "Time (HH:MM)", "Route"]]
-    sheet.update(f"A{start_row+1}:F{start_row+1}", headers)
-    sheet.format(f"A{start_row+1}:F{start_row+1}", {"textFormat": {"bold": True}})
-
-    # Add the data rows (unchanged)
+    return create_worksheets([base_name])[0]
+
+
+def _column(index):
+    # 1-based column number to its letter (sections never pass column Z)
+    return chr(ord("A") + index - 1)
+
+
+def _grid_range(sheet_id, row, first_column, last_column):
+    return {
+        "sheetId": sheet_id,
+        "startRowIndex": row - 1,
+        "endRowIndex": row,
+        "startColumnIndex": first_column - 1,
+        "endColumnIndex": last_column
+    }
+
+
+def _format_request(sheet_id, row, last_column, cell_format):
+    return {"repeatCell": {
+        "range": _grid_range(sheet_id, row, 1, last_column),
+        "cell": {"userEnteredFormat": cell_format},
+        "fields": f"userEnteredFormat({','.join(cell_format)})"
+    }}
+
+
+def _sheet_range(title, a1):
+    return "'{}'!{}".format(title.replace("'", "''"), a1)
+
+
+def locations_section(start_location, dump_location, pit_result, package):
+    start_map = f'https://www.google.com/maps?q={start_location["latitude"]},{start_location["longitude"]}'
+    start_point = f'{start_location["latitude"]}, {start_location["longitude"]}'
+    return {
+        "title": "LOCATIONS: START OF DAY, LOAD SITE, DUMP SITE, END OF DAY",
+        "headers": ["Location", "Activity", "LAT/LONG", "Location: Google Map Link"],
+        "rows": [
+            [start_location["address"], "Start of Day", start_point, start_map],
+            [start_location["address"], "End of Day", start_point, start_map],
+            [package if package else dump_location["address"], "Dumping", f'{dump_location["latitude"]}, {dump_location["longitude"]}', f'https://www.google.com/maps?q={dump_location["latitude"]},{dump_location["longitude"]}'],
+            ["Primary Pit", "Loading", f'{pit_result["latitude"]}, {pit_result["longitude"]}', f'https://www.google.com/maps?q={pit_result["latitude"]},{pit_result["longitude"]}']
+        ]
+    }
+
+
+def distance_section(start_location, dump_location, pit_result):
     ri = pit_result["route_info"]
+
+    def destination(leg):
+        return ri[leg]["route_url"].split("destination=")[-1].split("&")[0]
+
+    start_point = f'{start_location["latitude"]}, {start_location["longitude"]}'
+    return {
+        "title": "DISTANCE/SPEED/TIME TRAVELLED DOMESTIC VEHICLE",
+        "headers": ["", "", "", "Distance (km)", "Time (HH:MM)", "Route"],
+        "rows": [
+            ["START --> LOAD", start_point, destination("start_to_pit"), ri["start_to_pit"]["distance_km"], ri["start_to_pit"]["time_format"], ri["start_to_pit"]["route_url"]],
+            ["LOAD --> DUMP", destination("start_to_pit"), destination("pit_to_dump"), ri["pit_to_dump"]["distance_km"], ri["pit_to_dump"]["time_format"], ri["pit_to_dump"]["route_url"]],
+            ["DUMP --> LOAD", destination("pit_to_dump"), destination("dump_to_pit"), ri["dump_to_pit"]["distance_km"], ri["dump_to_pit"]["time_format"], ri["dump_to_pit"]["route_url"]],
+            ["DUMP --< END", destination("dump_to_pit"), start_point, ri["dump_to_start"]["distance_km"], ri["dump_to_start"]["time_format"], ri["dump_to_start"]["route_url"]],
+        ]
+    }
+
+
+def schedule_section(table):
+    """
+    Daily schedule section for one pit from its schedule_table, ending with
+    the TOTAL and Hourly Rate rows.
+    """
+    total_minutes = table["total_minutes"]
     rows = [
-        ["START --> LOAD", f'{start_location["latitude"]}, {start_location["longitude"]}', ri["start_to_pit"]["route_url"].split("destination=")[-1].split("&")[0], ri["start_to_pit"]["distance_km"], ri["start_to_pit"]["time_format"], ri["start_to_pit"]["route_url"]],
-        ["LOAD --> DUMP", ri["start_to_pit"]["route_url"].split("destination=")[-1].split("&")[0], ri["pit_to_dump"]["route_url"].split("destination=")[-1].split("&")[0], ri["pit_to_dump"]["distance_km"], ri["pit_to_dump"]["time_format"], ri["pit_to_dump"]["route_url"]],
-        ["DUMP --> LOAD", ri["pit_to_dump"]["route_url"].split("destination=")[-1].split("&")[0], ri["dump_to_pit"]["route_url"].split("destination=")[-1].split("&")[0], ri["dump_to_pit"]["distance_km"], ri["dump_to_pit"]["time_format"], ri["dump_to_pit"]["route_url"]],
-        ["DUMP --< END", ri["dump_to_pit"]["route_url"].split("destination=")[-1].split("&")[0], f'{start_location["latitude"]}, {start_location["longitude"]}', ri["dump_to_start"]["distance_km"], ri["dump_to_start"]["time_format"], ri["dump_to_start"]["route_url"]],
+        *table["rows"],
+        ["TOTAL", "", f"{total_minutes//60}:{str(total_minutes%60).zfill(2)}", "", "", f"${table['revenue']}", ""],
+        ["", "", "", "", "", "", ""],
+        ["Hourly Rate", "", "", "", "", f"${table['hourly_rate']:.2f}", ""]
     ]
-    sheet.update(f"A{start_row+2}:F{start_row+5}", rows)
-
-
-def write_schedule_section(sheet, pit_result, start_time_str, adjust_time, load_size, rate_per_tonne, total_trips):
-    EXTRA_TIME = 0
-    start_row = find_next_empty_row(sheet)
-    truck_earning = load_size * rate_per_tonne
-
-    # Add the title header and apply formatting - Keep as nested list
-    sheet.update(f"A{start_row}", [["ESTIMATED DAILY SCHEDULE + DAILY/HOURLY REVENUE"]])
-    
-    # Merge cells A to I in the header row
-    sheet.merge_cells(f"A{start_row}:I{start_row}")
-    
-    # Apply formatting - blue background, white text, bold, and center aligned
-    sheet.format(f"A{start_row}:I{start_row}", {
-        "textFormat": {"bold": True, "foregroundColor": {"red": 1.0, "green": 1.0, "blue": 1.0}},
-        "backgroundColor": {"red": 20/255, "green": 95/255, "blue": 130/255},
-        "horizontalAlignment": "CENTER",
-        "verticalAlignment": "MIDDLE"
-    })
-
-    # Keep headers as nested list
-    headers = [["Location", "Total Time", "Buffer", "Load/Dump", "Next Stop", "Truck Revenue", "Total Tonnes"]]
-    sheet.update(f"A{start_row+1}:G{start_row+1}", headers)
-    sheet.format(f"A{start_row+1}:G{start_row+1}", {"textFormat": {"bold": True}})
-
-    rows = []
-    current_time = datetime.strptime(start_time_str, "%H:%M")
-    total_minutes = 0
-
-    # Ensure Start of Day row has correct number of elements (7 columns: A-G)
-    rows.append(["Start of Day", "", current_time.strftime("%I:%M:%S %p"), "", "(START --> LOAD)", "", ""])
-
-    for i, route in enumerate(pit_result["routes"]):
-        steps = route["steps"]
-        trip_type = route["type"]
-
-        if trip_type == "work_cycle":
-            if i == 0:
-                travel_start_to_pit = next((s for s in steps if "Travel to Pit" in s["action"]), None)
-                load_step = next((s for s in steps if "Load" in s["action"]), None)
-                travel_minutes = int(travel_start_to_pit["time_taken"].split()[0]) if travel_start_to_pit else 0
-                load_minutes = int(load_step["time_taken"].split()[0]) if load_step else 0
-                trip_total = travel_minutes + load_minutes
-                if(adjust_time > 0):
-                    EXTRA_TIME = (trip_total/100) * adjust_time
-                current_time += timedelta(minutes=(trip_total+EXTRA_TIME))
-                total_minutes += (trip_total + EXTRA_TIME)
-                # Ensure 7 columns for this row
-                rows.append(["Load Site -Clean Pit", f"{trip_total//60}:{str(trip_total%60).zfill(2)}", current_time.strftime("%I:%M:%S %p"), "Load", "(LOAD --> DUMP)", "", load_size])
-            else:
-                return_to_pit = next((s for s in steps if "Return to Pit" in s["action"]), None)
-                load_step = next((s for s in steps if "Load" in s["action"]), None)
-                return_minutes = int(return_to_pit["time_taken"].split()[0]) if return_to_pit else 0
-                load_minutes = int(load_step["time_taken"].split()[0]) if load_step else 0
-                trip_total = return_minutes + load_minutes
-                if(adjust_time > 0):
-                    EXTRA_TIME = (trip_total/100) * adjust_time
-                current_time += timedelta(minutes=(trip_total+EXTRA_TIME))
-                total_minutes += (trip_total + EXTRA_TIME)
-                # Ensure 7 columns for this row
-                rows.append(["Load Site -Clean Pit", f"{trip_total//60}:{str(trip_total%60).zfill(2)}", current_time.strftime("%I:%M:%S %p"), "Load", "(LOAD --> DUMP)", "", load_size])
-
-            travel_to_dump = next((s for s in steps if "Travel to Dump" in s["action"]), None)
-            unload_step = next((s for s in steps if "Unload" in s["action"]), None)
-            travel_minutes = int(travel_to_dump["time_taken"].split()[0]) if travel_to_dump else 0
-            unload_minutes = int(unload_step["time_taken"].split()[0]) if unload_step else 0
-            trip_total = travel_minutes + unload_minutes
-            if(adjust_time > 0):
-                EXTRA_TIME = (trip_total/100) * adjust_time
-            current_time += timedelta(minutes=(trip_total+EXTRA_TIME))
-            total_minutes += (trip_total + EXTRA_TIME)
-            # Ensure 7 columns for this row
-            rows.append(["Dump Site", f"{trip_total//60}:{str(trip_total%60).zfill(2)}", current_time.strftime("%I:%M:%S %p"), "Dump", "(DUMP --> LOAD)", truck_earning, ""])
-
-        elif trip_type == "return_to_base":
-            return_step = steps[0]
-            return_minutes = int(return_step["time_taken"].split()[0])
-            if(adjust_time > 0):
-                EXTRA_TIME = (return_minutes/100) * adjust_time
-            current_time += timedelta(minutes=(return_minutes+EXTRA_TIME))
-            total_minutes += (return_minutes + EXTRA_TIME)
-            # Ensure 7 columns for this row
-            rows.append(["End of Day", f"{return_minutes//60}:{str(return_minutes%60).zfill(2)}", current_time.strftime("%I:%M:%S %p"), "", "(DUMP --< END)", "", ""])
-
-        elif trip_type == "final_trip":
-            travel_to_pit = next((s for s in steps if "Travel to Pit" in s["action"]), None)
-            load_step = next((s for s in steps if "Load" in s["action"]), None)
-            travel_to_dump = next((s for s in steps if "Travel to Dump" in s["action"]), None)
-            unload_step = next((s for s in steps if "Unload" in s["action"]), None)
-            return_step = next((s for s in steps if "Return to Base" in s["action"]), None)
-
-            # Try to get 'Return to Pit' from previous trip if not present in current
-            return_to_pit = None
-            if not travel_to_pit and i > 0:
-                prev_steps = pit_result["routes"][i - 1]["steps"]
-                return_to_pit = next((s for s in reversed(prev_steps) if "Return to Pit" in s["action"]), None)
-
-            # Load Site row = travel to pit + load (or return to pit + load)
-            load_minutes = 0
-            if travel_to_pit:
-                load_minutes += int(travel_to_pit["time_taken"].split()[0])
-            elif return_to_pit:
-                load_minutes += int(return_to_pit["time_taken"].split()[0])
-            if load_step:
-                load_minutes += int(load_step["time_taken"].split()[0])
-
-            if load_minutes > 0:
-                if adjust_time > 0:
-                    EXTRA_TIME = (load_minutes / 100) * adjust_time
-                current_time += timedelta(minutes=(load_minutes + EXTRA_TIME))
-                total_minutes += (load_minutes + EXTRA_TIME)
-                # Ensure 7 columns for this row
-                rows.append(["Load Site -Clean Pit", f"{int(load_minutes)//60}:{str(int(load_minutes)%60).zfill(2)}", current_time.strftime("%I:%M:%S %p"), "Load", "(LOAD --> DUMP)", "", load_size])
-
-            # Dump Site row = travel to dump + unload
-            dump_minutes = 0
-            if travel_to_dump:
-                dump_minutes += int(travel_to_dump["time_taken"].split()[0])
-            if unload_step:
-                dump_minutes += int(unload_step["time_taken"].split()[0])
-            if dump_minutes > 0:
-                if adjust_time > 0:
-                    EXTRA_TIME = (dump_minutes / 100) * adjust_time
-                current_time += timedelta(minutes=(dump_minutes + EXTRA_TIME))
-                total_minutes += (dump_minutes + EXTRA_TIME)
-                # Ensure 7 columns for this row
-                rows.append(["Dump Site", f"{int(dump_minutes)//60}:{str(int(dump_minutes)%60).zfill(2)}", current_time.strftime("%I:%M:%S %p"), "Dump", "(DUMP --> END)", truck_earning, ""])
-
-            # Return to Base
-            if return_step:
-                return_minutes = int(return_step["time_taken"].split()[0])
-                if adjust_time > 0:
-                    EXTRA_TIME = (return_minutes / 100) * adjust_time
-                current_time += timedelta(minutes=(return_minutes + EXTRA_TIME))
-                total_minutes += (return_minutes + EXTRA_TIME)
-                # Ensure 7 columns for this row
-                rows.append(["End of Day", f"{return_minutes//60}:{str(return_minutes%60).zfill(2)}", current_time.strftime("%I:%M:%S %p"), "", "(DUMP --< END)", "", ""])
-                # Empty row also needs 7 columns
-                rows.append(["", "", "", "", "", "", ""])
-
-    total_minutes = int(total_minutes)
-    sheet.update(f"A{start_row+2}:G{start_row+2+len(rows)-1}", rows)
-    print("total minutes at the end of the day: ", total_minutes)
-    
-    # Make sure these have 7 elements, not 6
-
-    sheet.update(f"A{start_row+2+len(rows)}:G{start_row+2+len(rows)}", [["TOTAL", "", f"{total_minutes//60}:{str(total_minutes%60).zfill(2)}", "", "", f"${truck_earning * total_trips}", ""]])
-
-    # Add an empty row after the "Total" row - ensure 7 columns
-    sheet.update(f"A{start_row+2+len(rows)+1}:G{start_row+2+len(rows)+1}", [["", "", "", "", "", "", ""]])
-
-    # Calculate hourly rate and update the "Hourly Rate" row - ensure 7 columns
-    hourly_rate = truck_earning * total_trips / (total_minutes / 60) if total_minutes > 0 else 0
-    sheet.update(f"A{start_row+2+len(rows)+2}:G{start_row+2+len(rows)+2}", [["Hourly Rate", "", "", "", "", f"${hourly_rate:.2f}", ""]])
-
+    return {
+        "title": "ESTIMATED DAILY SCHEDULE + DAILY/HOURLY REVENUE",
+        "headers": ["Location", "Total Time", "Buffer", "Load/Dump", "Next Stop", "Truck Revenue", "Total Tonnes"],
+        "rows": rows
+    }
+
+
+def layout_sections(sections, first_row=1):
+    """
+    Place sections one after another from first_row: a banner row merged
+    across A:I, a bold header row, then the data rows. Returns (blocks,
+    merges, formats) as (row, values), (row, last column) and (row, last
+    column, format) tuples, shared by every output sink.
+    """
+    blocks, merges, formats = [], [], []
+    row = first_row
+    for section in sections:
+        body = [section["headers"], *section["rows"]]
+        blocks.append((row, [[section["title"]]]))
+        blocks.append((row + 1, body))
+        merges.append((row, BANNER_COLUMNS))
+        formats.append((row, BANNER_COLUMNS, HEADER_FORMAT))
+        formats.append((row + 1, len(section["headers"]), {"textFormat": {"bold": True}}))
+        row += 1 + len(body)
+    return blocks, merges, formats
+
+
+def render_sections(title, sheet_id, sections, first_row=1):
+    """
+    Sheets API payloads for laid out sections: the value ranges and the
+    merge/format requests, so a worksheet is written in two API calls.
+    """
+    blocks, merges, formats = layout_sections(sections, first_row)
+    data = []
+    for row, values in blocks:
+        a1 = f"A{row}" if len(values) == 1 and len(values[0]) == 1 else f"A{row}:{_column(len(values[0]))}{row+len(values)-1}"
+        data.append({"range": _sheet_range(title, a1), "values": values})
+    requests = [
+        {"mergeCells": {"range": _grid_range(sheet_id, row, 1, last_column), "mergeType": "MERGE_ALL"}}
+        for row, last_column in merges
+    ]
+    requests.extend(_format_request(sheet_id, row, last_column, cell_format) for row, last_column, cell_format in formats)
+    return data, requests
+
+
+def write_sheets(targets):
+    """
+    Write sections to several fresh worksheets, given as (title, sheet id,
+    sections), with one values update and one formatting update in total.
+    """
+    data, requests = [], []
+    for title, sheet_id, sections in targets:
+        sheet_data, sheet_requests = render_sections(title, sheet_id, sections)
+        data.extend(sheet_data)
+        requests.extend(sheet_requests)
+    sh = get_spreadsheet()
+    sheets_call(sh.values_batch_update, {"valueInputOption": "RAW", "data": data})
+    sheets_call(sh.batch_update, {"requests": requests})
+
+
+def write_sections(sheet, sections):
+    """
+    Write rendered sections to a fresh worksheet with one values update and
+    one formatting update.
+    """
+    write_sheets([(sheet.title, sheet.id, sections)])
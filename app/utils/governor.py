@@ -0,0 +1,311 @@
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+
+from app.config import (
+    GOOGLE_API_QPS,
+    GOOGLE_API_BURST,
+    GOOGLE_API_ENDPOINT_QPS,
+    GOOGLE_API_MAX_ATTEMPTS,
+    GOOGLE_API_BACKOFF_BASE_SECONDS,
+    GOOGLE_API_BACKOFF_MAX_SECONDS,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_RESET_SECONDS,
+    RATE_LIMIT_BACKEND,
+    CACHE_DB_PATH
+)
+from app.utils.cache import sqlite_connection
+from app.utils.metrics import REGISTRY, Gauge, upstream_retries, upstream_rejections
+
+logger = logging.getLogger("app.governor")
+
+RETRYABLE_HTTP_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_API_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+
+class RetryableError(Exception):
+    """
+    Raised by a governed call when the upstream asks us to try again later.
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised without calling upstream while an endpoint's circuit is open.
+    """
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"{endpoint} is unavailable, retry in {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `rate` tokens per second.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # Take a token now, possibly going into debt; return the wait needed
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class SQLiteTokenBucket(TokenBucket):
+    """
+    Token bucket whose state lives in the shared SQLite database, so every
+    worker process on the host draws from one budget. Falls back to the
+    in-process bucket if the database is unavailable.
+    """
+
+    def __init__(self, name, rate, capacity=None, path=CACHE_DB_PATH):
+        super().__init__(rate, capacity)
+        self.name = name
+        self.path = path
+        self._ready = False
+
+    def _reserve(self):
+        try:
+            return self._reserve_shared()
+        except sqlite3.Error as e:
+            logger.error(f"Shared token bucket {self.name} unavailable, using local budget: {e}")
+            return super()._reserve()
+
+    def _reserve_shared(self):
+        conn = sqlite_connection(self.path)
+        if not self._ready:
+            conn.execute("CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            self._ready = True
+        # Wall-clock time, since monotonic clocks are not comparable across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+            tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)", (self.name, tokens, now))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+    async def acquire_async(self):
+        # BEGIN IMMEDIATE can wait on another worker's write lock; never on the event loop
+        wait = await asyncio.to_thread(self._reserve)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+def make_bucket(name, rate, capacity=None):
+    """
+    Return a token bucket for the configured RATE_LIMIT_BACKEND.
+    """
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteTokenBucket(name, rate, capacity)
+    return TokenBucket(rate, capacity)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and lets one trial
+    call through once `reset_seconds` have passed (half-open). Other calls
+    are rejected until the trial succeeds or fails; a trial still in flight
+    after another `reset_seconds` is presumed lost and replaced.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.trial_started_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError if the call may not go out. Returns True if
+        the caller is the half-open trial.
+        """
+        with self._lock:
+            state = self.state
+            if state == "open":
+                raise CircuitOpenError(self.name, self.reset_seconds - (time.monotonic() - self.opened_at))
+            if state == "closed":
+                return False
+            now = time.monotonic()
+            if self.trial_in_flight and now - self.trial_started_at < self.reset_seconds:
+                raise CircuitOpenError(self.name, self.reset_seconds - (now - self.trial_started_at))
+            self.trial_in_flight = True
+            self.trial_started_at = now
+            return True
+
+    def release_trial(self):
+        """
+        Give up the trial without an outcome (cancelled, or a non-retryable
+        error) so the next caller can make it.
+        """
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.trial_in_flight = False
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+def parse_endpoint_budgets(spec):
+    """
+    Parse "geocode=20,directions=20" into {"geocode": 20.0, "directions": 20.0}.
+    """
+    budgets = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        budgets[name.strip()] = float(value)
+    return budgets
+
+
+def backoff_delay(attempt, base=GOOGLE_API_BACKOFF_BASE_SECONDS, cap=GOOGLE_API_BACKOFF_MAX_SECONDS):
+    """
+    Full-jitter exponential backoff for a zero-based retry attempt.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class Governor:
+    """
+    Shared outbound-call governor: a global QPS bucket, per-endpoint QPS
+    budgets, retries with jittered exponential backoff and a circuit breaker
+    per endpoint.
+    """
+
+    def __init__(self, qps=GOOGLE_API_QPS, burst=GOOGLE_API_BURST, endpoint_qps=None, max_attempts=GOOGLE_API_MAX_ATTEMPTS):
+        self.bucket = make_bucket("global", qps, burst)
+        self.endpoint_qps = parse_endpoint_budgets(GOOGLE_API_ENDPOINT_QPS) if endpoint_qps is None else endpoint_qps
+        self.max_attempts = max_attempts
+        self._endpoint_buckets = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def endpoint_bucket(self, endpoint):
+        with self._lock:
+            if endpoint not in self._endpoint_buckets:
+                rate = self.endpoint_qps.get(endpoint)
+                self._endpoint_buckets[endpoint] = make_bucket(endpoint, rate) if rate else None
+            return self._endpoint_buckets[endpoint]
+
+    def breaker(self, endpoint):
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(endpoint)
+            return self._breakers[endpoint]
+
+    async def call(self, endpoint, func, *args, retry_on=(RetryableError,), max_attempts=None, backoff_base=None, **kwargs):
+        """
+        Run `await func(*args, **kwargs)` under the endpoint's budget, retrying
+        exceptions listed in retry_on with backoff. A call that exhausts its
+        attempts counts as one failure towards opening the circuit.
+        """
+        max_attempts = max_attempts or self.max_attempts
+        backoff_base = backoff_base or GOOGLE_API_BACKOFF_BASE_SECONDS
+        breaker = self.breaker(endpoint)
+        endpoint_bucket = self.endpoint_bucket(endpoint)
+        for attempt in range(max_attempts):
+            try:
+                trial = breaker.before_call()
+            except CircuitOpenError:
+                upstream_rejections.inc(endpoint=endpoint)
+                raise
+            try:
+                await self.bucket.acquire_async()
+                if endpoint_bucket is not None:
+                    await endpoint_bucket.acquire_async()
+                result = await func(*args, **kwargs)
+            except retry_on as e:
+                if attempt + 1 >= max_attempts:
+                    # One failure per exhausted call, not per attempt
+                    breaker.record_failure()
+                    logger.error(f"[{endpoint}] Giving up after {attempt + 1} attempts: {e}")
+                    raise
+                if trial:
+                    breaker.release_trial()
+                delay = backoff_delay(attempt, base=backoff_base)
+                upstream_retries.inc(endpoint=endpoint)
+                logger.warning(f"[{endpoint}] Attempt {attempt + 1} failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except BaseException:
+                if trial:
+                    breaker.release_trial()
+                raise
+            else:
+                breaker.record_success()
+                return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                endpoint: {"state": breaker.state, "failures": breaker.failures}
+                for endpoint, breaker in self._breakers.items()
+            }
+
+
+# Shared by every Google Maps call in the process
+google_governor = Governor()
+
+circuit_state = Gauge(
+    "upstream_circuit_state", "Circuit breaker state per endpoint (0 closed, 1 half open, 2 open).", ["endpoint"]
+)
+_CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+@REGISTRY.register_collector
+def collect_circuits():
+    for endpoint, stats in google_governor.stats().items():
+        circuit_state.set(_CIRCUIT_STATES[stats["state"]], endpoint=endpoint)
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from urllib.parse import urlparse
+
+import httpx
+
+from app.config import (
+    HTTP_TIMEOUT_SECONDS,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    HTTP_KEEPALIVE_EXPIRY_SECONDS
+)
+from app.utils.metrics import http_in_flight
+
+logger = logging.getLogger("app.http")
+
+# Network-level failures (connect errors, timeouts) that are safe to retry
+TransportError = httpx.TransportError
+
+# All outbound geo traffic runs on one dedicated event loop thread so a single
+# keep-alive connection pool is shared by async callers (from any loop) and by
+# the synchronous compatibility wrappers.
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+_host_limits = {}
+
+
+def get_loop():
+    """
+    Return the shared HTTP event loop, starting its thread on first use.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="http-loop", daemon=True)
+                thread.start()
+                _loop = loop
+    return _loop
+
+
+def get_client():
+    """
+    Return the pooled AsyncClient. Must be called on the HTTP loop.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+        )
+    return _client
+
+
+def _host_limit(url):
+    host = urlparse(url).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+    return _host_limits[host]
+
+
+async def request(method, url, **kwargs):
+    """
+    Send a request through the shared pool, bounded per host.
+    """
+    async with _host_limit(url):
+        with http_in_flight.track_inprogress(host=urlparse(url).netloc):
+            return await get_client().request(method, url, **kwargs)
+
+
+async def get(url, **kwargs):
+    return await request("GET", url, **kwargs)
+
+
+async def fetch_redirect(url, headers=None):
+    """
+    Issue a GET without following redirects and without reading the body.
+    Returns (status_code, Location header or None).
+    """
+    async with _host_limit(url):
+        with http_in_flight.track_inprogress(host=urlparse(url).netloc):
+            async with get_client().stream("GET", url, headers=headers, follow_redirects=False) as response:
+                return response.status_code, response.headers.get("location")
+
+
+def _on_loop():
+    try:
+        return asyncio.get_running_loop() is _loop
+    except RuntimeError:
+        return False
+
+
+async def _in_context(coro, ctx):
+    # Carry the caller's context variables (e.g. the active trace span) onto the HTTP loop
+    for var, value in ctx.items():
+        var.set(value)
+    return await coro
+
+
+def _submit(coro):
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), get_loop())
+
+
+def run_sync(coro):
+    """
+    Run a coroutine on the HTTP loop and block until it finishes.
+    """
+    if _on_loop():
+        coro.close()
+        raise RuntimeError("run_sync() cannot be called from the HTTP loop; await the coroutine instead")
+    return _submit(coro).result()
+
+
+async def run_async(coro):
+    """
+    Await a coroutine on the HTTP loop from any event loop.
+    """
+    if _on_loop():
+        return await coro
+    return await asyncio.wrap_future(_submit(coro))
+
+
+def on_http_loop(func):
+    """
+    Decorator for coroutine functions that must execute on the HTTP loop.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_async(func(*args, **kwargs))
+    return wrapper
+
+
+def close():
+    """
+    Close the pooled client and stop the HTTP loop.
+    """
+    global _client, _loop
+    if _loop is None:
+        return
+    if _client is not None:
+        asyncio.run_coroutine_threadsafe(_client.aclose(), _loop).result()
+        _client = None
+    _loop.call_soon_threadsafe(_loop.stop)
+    _loop = None
+    _host_limits.clear()
@@ -0,0 +1,70 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; locks degrade to no-ops
+    fcntl = None
+
+logger = logging.getLogger("app.locks")
+
+
+class ProcessLock:
+    """
+    Exclusive advisory lock on a file (flock), shared by every process on
+    the host. Not re-entrant; use one instance per holder.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def acquire(self, timeout=30, poll=0.05):
+        """
+        Wait up to timeout seconds for the lock. Returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+    async def acquire_async(self, timeout=30, poll=0.05):
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(poll)
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def striped_lock(directory, name, key, stripes=256):
+    """
+    Return a ProcessLock for key out of a fixed set of lock files per name,
+    so the lock directory does not grow with the number of keys.
+    """
+    stripe = int(hashlib.sha1(str(key).encode()).hexdigest()[:8], 16) % stripes
+    return ProcessLock(os.path.join(directory, f"{name}-{stripe:03d}.lock"))
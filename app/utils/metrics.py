@@ -0,0 +1,218 @@
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from app.utils.cache import all_caches
+from app.utils.singleflight import all_flights
+
+logger = logging.getLogger("app.metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    Metrics exposed in the Prometheus text format. Collectors are callbacks
+    run before each render to refresh gauges from live state.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, func):
+        with self._lock:
+            self._collectors.append(func)
+        return func
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collect in collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.error(f"Metrics collector {collect.__name__} failed: {e}")
+        return "".join(metric.render() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._samples(key, value))
+        return "\n".join(lines) + "\n"
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, key, value):
+        counts, total = value
+        samples = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+            samples.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        samples.append(f"{self.name}_sum{labels} {total!r}")
+        samples.append(f"{self.name}_count{labels} {cumulative}")
+        return samples
+
+
+# Pipeline and upstream instrumentation shared across modules
+stage_seconds = Histogram(
+    "route_pipeline_stage_seconds", "Time spent in each multi-pit pipeline stage.", ["stage"]
+)
+pipelines_in_flight = Gauge(
+    "route_pipelines_in_flight", "Multi-pit pipelines currently running."
+)
+upstream_requests = Counter(
+    "upstream_requests_total", "Google API requests by endpoint and response status.", ["endpoint", "status"]
+)
+upstream_seconds = Histogram(
+    "upstream_request_seconds", "Google API request latency by endpoint.", ["endpoint"]
+)
+upstream_retries = Counter(
+    "upstream_retries_total", "Google API calls retried after a retryable failure.", ["endpoint"]
+)
+upstream_rejections = Counter(
+    "upstream_circuit_rejections_total", "Google API calls refused while the endpoint's circuit was open.", ["endpoint"]
+)
+http_in_flight = Gauge(
+    "upstream_requests_in_flight", "Outbound HTTP requests currently open, by host.", ["host"]
+)
+
+cache_hits = Gauge("cache_hits", "Cache hits since start.", ["cache"])
+cache_misses = Gauge("cache_misses", "Cache misses since start.", ["cache"])
+cache_hit_ratio = Gauge("cache_hit_ratio", "Cache hits over lookups since start.", ["cache"])
+cache_size = Gauge("cache_entries", "Entries held in memory by each cache.", ["cache"])
+flight_executed = Gauge("singleflight_executed", "Lookups executed (not coalesced) since start.", ["flight"])
+flight_coalesced = Gauge("singleflight_coalesced", "Lookups that joined an in-flight call since start.", ["flight"])
+flight_in_flight = Gauge("singleflight_in_flight", "Distinct lookups currently in flight.", ["flight"])
+
+
+@REGISTRY.register_collector
+def collect_caches():
+    for cache in all_caches():
+        stats = cache.stats()
+        cache_hits.set(stats["hits"], cache=stats["name"])
+        cache_misses.set(stats["misses"], cache=stats["name"])
+        cache_hit_ratio.set(stats["hit_ratio"], cache=stats["name"])
+        cache_size.set(stats["size"], cache=stats["name"])
+    for flight in all_flights():
+        stats = flight.stats()
+        flight_executed.set(stats["executed"], flight=stats["name"])
+        flight_coalesced.set(stats["coalesced"], flight=stats["name"])
+        flight_in_flight.set(stats["in_flight"], flight=stats["name"])
+
+
+def render():
+    """
+    Render every registered metric in the Prometheus text exposition format.
+    """
+    return REGISTRY.render()
@@ -0,0 +1,305 @@
+import csv
+import math
+import heapq
+import asyncio
+import logging
+import threading
+from array import array
+
+from app.config import (
+    GOOGLE_API_KEY,
+    ROUTING_PROVIDER,
+    LOCAL_GRAPH_PATH,
+    LOCAL_GRAPH_MAX_SNAP_METERS,
+    ESTIMATOR_SPEED_KPH,
+    ESTIMATOR_DETOUR_FACTOR
+)
+from app.utils.cache import TTLCache
+from app.utils.geo import build_leg, get_directions_async
+
+logger = logging.getLogger("app.providers")
+
+EARTH_RADIUS_M = 6371000.0
+_SNAP_CELL_DEGREES = 0.01
+_SNAP_MAX_RINGS = 6
+
+
+def haversine_m(a, b):
+    """
+    Great-circle distance in metres between two (lat, lng) points.
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+def make_leg(start, end, seconds, meters):
+    """
+    Build a scheduler leg dict from a locally computed duration and distance.
+    """
+    return build_leg(start, end, {
+        "duration": {"value": int(round(seconds))},
+        "distance": {"value": meters, "text": f"{meters / 1000:.1f} km"}
+    })
+
+
+class RoutingProvider:
+    """
+    Source of leg dicts for the scheduler. get_leg returns None when the
+    provider cannot answer so a chained fallback can take over.
+    """
+    name = ""
+
+    async def get_leg(self, start, end):
+        raise NotImplementedError
+
+
+class GoogleRoutingProvider(RoutingProvider):
+    """
+    Live Google Directions (cached, coalesced and governed in app.utils.geo).
+    """
+    name = "google"
+
+    async def get_leg(self, start, end):
+        return await get_directions_async(start, end, GOOGLE_API_KEY)
+
+
+class HaversineRoutingProvider(RoutingProvider):
+    """
+    Straight-line distance times a detour factor at a fixed average speed.
+    """
+    name = "haversine"
+
+    def __init__(self, speed_kph=ESTIMATOR_SPEED_KPH, detour_factor=ESTIMATOR_DETOUR_FACTOR):
+        self.speed_mps = speed_kph / 3.6
+        self.detour_factor = detour_factor
+
+    async def get_leg(self, start, end):
+        meters = haversine_m(start, end) * self.detour_factor
+        return make_leg(start, end, meters / self.speed_mps, meters)
+
+
+class RoadGraph:
+    """
+    Compact array-backed (CSR) road graph with A* shortest-time queries.
+
+    Built from an OSM-derived edge list CSV with the columns
+    u,v,u_lat,u_lng,v_lat,v_lng,length_m,speed_kph[,oneway].
+    """
+
+    def __init__(self, lats, lngs, offsets, targets, seconds, meters):
+        self.lats = lats
+        self.lngs = lngs
+        self.offsets = offsets
+        self.targets = targets
+        self.seconds = seconds
+        self.meters = meters
+        self.max_speed_mps = max(
+            (meters[i] / seconds[i] for i in range(len(seconds)) if seconds[i] > 0), default=1.0
+        )
+        self._cells = {}
+        for node in range(len(lats)):
+            self._cells.setdefault(self._cell(lats[node], lngs[node]), []).append(node)
+
+    @classmethod
+    def from_edge_list(cls, path):
+        index = {}
+        lats = array("d")
+        lngs = array("d")
+        edges = []
+
+        def node(node_id, lat, lng):
+            if node_id not in index:
+                index[node_id] = len(lats)
+                lats.append(float(lat))
+                lngs.append(float(lng))
+            return index[node_id]
+
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                u = node(row["u"], row["u_lat"], row["u_lng"])
+                v = node(row["v"], row["v_lat"], row["v_lng"])
+                length = float(row["length_m"])
+                travel = length / (float(row["speed_kph"]) / 3.6)
+                edges.append((u, v, travel, length))
+                if row.get("oneway", "0").strip().lower() not in ("1", "true", "yes"):
+                    edges.append((v, u, travel, length))
+
+        edges.sort(key=lambda e: e[0])
+        offsets = array("l", [0] * (len(lats) + 1))
+        targets = array("l")
+        seconds = array("d")
+        meters = array("d")
+        for u, v, travel, length in edges:
+            offsets[u + 1] += 1
+            targets.append(v)
+            seconds.append(travel)
+            meters.append(length)
+        for i in range(len(lats)):
+            offsets[i + 1] += offsets[i]
+        logger.debug(f"Loaded road graph from {path}: {len(lats)} nodes, {len(targets)} edges")
+        return cls(lats, lngs, offsets, targets, seconds, meters)
+
+    @staticmethod
+    def _cell(lat, lng):
+        return int(lat // _SNAP_CELL_DEGREES), int(lng // _SNAP_CELL_DEGREES)
+
+    def nearest_node(self, point):
+        """
+        Return (node, distance_m) for the closest node, searching grid cells
+        in growing rings around the point.  A hit in one ring can still be
+        beaten by a node just across a cell boundary in the next, so rings
+        keep being scanned until none of their cells can be closer than the
+        best node found.
+        """
+        ci, cj = self._cell(point[0], point[1])
+        # Narrowest cell side in metres (longitude cells shrink towards the
+        # poles), with some slack so the bound stays conservative.
+        cell_m = 0.9 * math.radians(_SNAP_CELL_DEGREES) * EARTH_RADIUS_M * max(
+            math.cos(math.radians(min(abs(point[0]) + _SNAP_CELL_DEGREES, 90.0))), 0.01)
+        best, best_d = None, float("inf")
+        for ring in range(0, _SNAP_MAX_RINGS * 2):
+            if best is None and ring >= _SNAP_MAX_RINGS:
+                break
+            if best is not None and (ring - 1) * cell_m >= best_d:
+                break
+            for i in range(ci - ring, ci + ring + 1):
+                for j in range(cj - ring, cj + ring + 1):
+                    if max(abs(i - ci), abs(j - cj)) != ring:
+                        continue
+                    for node in self._cells.get((i, j), ()):
+                        d = haversine_m(point, (self.lats[node], self.lngs[node]))
+                        if d < best_d:
+                            best, best_d = node, d
+        return best, best_d
+
+    def shortest_path(self, source, target):
+        """
+        A* over travel time. Returns (seconds, metres) or None if unreachable.
+        """
+        target_point = (self.lats[target], self.lngs[target])
+
+        def heuristic(node):
+            return haversine_m((self.lats[node], self.lngs[node]), target_point) / self.max_speed_mps
+
+        best = {source: 0.0}
+        dist = {source: 0.0}
+        heap = [(heuristic(source), 0.0, source)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                return cost, dist[node]
+            if cost > best[node]:
+                continue
+            for e in range(self.offsets[node], self.offsets[node + 1]):
+                nxt = self.targets[e]
+                new_cost = cost + self.seconds[e]
+                if new_cost < best.get(nxt, float("inf")):
+                    best[nxt] = new_cost
+                    dist[nxt] = dist[node] + self.meters[e]
+                    heapq.heappush(heap, (new_cost + heuristic(nxt), new_cost, nxt))
+        return None
+
+
+class LocalGraphRoutingProvider(RoutingProvider):
+    """
+    Offline shortest-time routing over a local road-network extract. Points
+    are snapped to the nearest graph node; the snap offsets are costed with
+    the straight-line estimator.
+    """
+    name = "local"
+
+    def __init__(self, path=LOCAL_GRAPH_PATH, max_snap_meters=LOCAL_GRAPH_MAX_SNAP_METERS):
+        self.path = path
+        self.max_snap_meters = max_snap_meters
+        self.estimator = HaversineRoutingProvider()
+        self.route_cache = TTLCache("local_routes", maxsize=50000)
+        self._graph = None
+        self._load_failed = False
+        self._lock = threading.Lock()
+
+    @property
+    def graph(self):
+        """
+        The road graph, loaded on first use. None if it could not be loaded;
+        a failed load is logged once and not retried.
+        """
+        if self._graph is None and not self._load_failed:
+            with self._lock:
+                if self._graph is None and not self._load_failed:
+                    try:
+                        self._graph = RoadGraph.from_edge_list(self.path)
+                    except Exception as e:
+                        logger.error(f"Could not load road graph {self.path}, using the straight-line estimate: {e}")
+                        self._load_failed = True
+        return self._graph
+
+    def route(self, start, end):
+        if not self.path or self.graph is None:
+            return None
+        key = (tuple(start), tuple(end))
+        leg = self.route_cache.get(key)
+        if leg is None:
+            # False marks legs the graph cannot route, so they are not retried
+            leg = self._route(start, end) or False
+            self.route_cache.set(key, leg)
+        return dict(leg) if leg else None
+
+    def _route(self, start, end):
+        graph = self.graph
+        source, source_offset = graph.nearest_node(start)
+        target, target_offset = graph.nearest_node(end)
+        if source is None or target is None or max(source_offset, target_offset) > self.max_snap_meters:
+            logger.debug(f"Could not snap {start} -> {end} to the road graph")
+            return None
+        path = graph.shortest_path(source, target)
+        if path is None:
+            return None
+        seconds, meters = path
+        offset_m = (source_offset + target_offset) * self.estimator.detour_factor
+        return make_leg(start, end, seconds + offset_m / self.estimator.speed_mps, meters + offset_m)
+
+    async def get_leg(self, start, end):
+        return await asyncio.to_thread(self.route, start, end)
+
+
+class ChainedRoutingProvider(RoutingProvider):
+    """
+    Ask each provider in turn and return the first leg answered.
+    """
+
+    def __init__(self, name, providers):
+        self.name = name
+        self.providers = providers
+
+    async def get_leg(self, start, end):
+        for provider in self.providers:
+            try:
+                leg = await provider.get_leg(start, end)
+            except Exception as e:
+                logger.warning(f"Routing provider {provider.name} failed for {start} -> {end}: {e}")
+                continue
+            if leg is not None:
+                return leg
+        raise Exception(f"No routing provider could route {start} -> {end}")
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name=None):
+    """
+    Return the routing provider registered under name (default ROUTING_PROVIDER).
+    "local" falls back to the straight-line estimator for legs off the graph.
+    """
+    name = name or ROUTING_PROVIDER
+    with _providers_lock:
+        if not _providers:
+            estimator = HaversineRoutingProvider()
+            _providers["google"] = GoogleRoutingProvider()
+            _providers["haversine"] = estimator
+            _providers["local"] = ChainedRoutingProvider("local", [LocalGraphRoutingProvider(), estimator])
+        if name not in _providers:
+            raise Exception(f"Unknown routing provider: {name}")
+        return _providers[name]
@@ -0,0 +1,424 @@
+import logging
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+
+from app.config import (
+    LOADING_TIME_MINUTES,
+    UNLOADING_TIME_MINUTES,
+    OVERTIME_ALLOWANCE_MINUTES
+)
+
+logger = logging.getLogger("app.schedule")
+
+SECONDS_PER_DAY = 24 * 3600
+
+# Typed step kinds; a trip is a sequence of (kind, leg name) pairs, the leg
+# name keying route_segments (None for loading and unloading)
+TRAVEL_TO_PIT = "travel_to_pit"
+LOAD = "load"
+TRAVEL_TO_DUMP = "travel_to_dump"
+UNLOAD = "unload"
+RETURN_TO_PIT = "return_to_pit"
+RETURN_TO_BASE = "return_to_base"
+
+
+def format_clock(seconds):
+    """
+    Format seconds since midnight as HH:MM, wrapping past midnight like strftime.
+    """
+    seconds %= SECONDS_PER_DAY
+    return f"{seconds // 3600:02d}:{(seconds // 60) % 60:02d}"
+
+
+def _duration(leg):
+    return leg["duration_seconds"] if leg else 0
+
+
+class Step:
+    """
+    One step of a trip: its kind, the route_segments leg it travels (None
+    while loading or unloading) and its start and end in seconds since midnight.
+    """
+    __slots__ = ("kind", "leg", "start_s", "end_s")
+
+    def __init__(self, kind, leg, start_s, end_s):
+        self.kind = kind
+        self.leg = leg
+        self.start_s = start_s
+        self.end_s = end_s
+
+    def __repr__(self):
+        return f"Step({self.kind!r}, {self.leg!r}, {self.start_s}, {self.end_s})"
+
+
+class Schedule:
+    """
+    Closed-form daily schedule for a single pit, computed in integer seconds.
+
+    The number of full cycles, the final half-cycle vs. return-to-base
+    decision and the overtime are derived in O(1) from the leg durations.
+    Steps are Step records over the shared route_segments leg table; the
+    per-step dicts are only built when `routes` is iterated or indexed.
+    """
+
+    def __init__(self, route_segments, start_time, work_hours, pit_name="", adjust_time=0):
+        self.route_segments = route_segments
+        self.start_time = start_time
+        self.work_hours = work_hours
+        self.pit_name = pit_name
+        self.adjust_time = adjust_time
+        self._step_fields = {}
+
+        start = datetime.strptime(start_time, "%H:%M")
+        self.start_s = start.hour * 3600 + start.minute * 60
+        self.scheduled_end_s = self.start_s + int(work_hours * 3600)
+        self.max_end_s = self.scheduled_end_s + OVERTIME_ALLOWANCE_MINUTES * 60
+
+        adj = self.adjust
+        legs = route_segments
+        starts_at_pit = legs["start_to_pit"] is None
+        load_s = LOADING_TIME_MINUTES * 60
+        unload_s = UNLOADING_TIME_MINUTES * 60
+        to_pit_s = _duration(legs["start_to_pit"])
+        pit_to_dump_s = _duration(legs["pit_to_dump"])
+        dump_to_pit_s = _duration(legs["dump_to_pit"])
+        dump_to_start_s = _duration(legs["dump_to_start"])
+        pit_to_start_s = _duration(legs["pit_to_start"])
+
+        # Actual time advanced by a cycle; every step is adjusted separately
+        self.load_s = adj(load_s)
+        self.unload_s = adj(unload_s)
+        self.cycle_s = self.load_s + adj(pit_to_dump_s) + self.unload_s + adj(dump_to_pit_s)
+        self.first_cycle_s = self.cycle_s + (0 if starts_at_pit else adj(to_pit_s))
+        if self.cycle_s <= 0:
+            raise ValueError("adjust_time leaves no time for a work cycle")
+
+        # Time a cycle plus the trip home is predicted to take (adjusted as a whole)
+        return_s = adj(pit_to_start_s)
+        cycle_raw_s = load_s + pit_to_dump_s + unload_s + dump_to_pit_s
+        predicted_s = adj(cycle_raw_s) + return_s
+        first_predicted_s = adj(cycle_raw_s + (0 if starts_at_pit else to_pit_s)) + return_s
+
+        cycles = 0
+        end_s = self.start_s
+        if end_s + first_predicted_s <= self.max_end_s:
+            end_s += self.first_cycle_s
+            cycles = 1
+            slack_s = self.max_end_s - predicted_s - end_s
+            if slack_s >= 0:
+                extra = slack_s // self.cycle_s + 1
+                cycles += extra
+                end_s += extra * self.cycle_s
+        self.cycles = cycles
+        self.cycles_end_s = end_s
+
+        # Last trip: pit -> dump -> base if it fits, otherwise straight home
+        at_pit = starts_at_pit or cycles > 0
+        half_cycle_s = adj(
+            (0 if at_pit else to_pit_s) + load_s + pit_to_dump_s + unload_s + dump_to_start_s
+        )
+        if end_s + half_cycle_s <= self.max_end_s:
+            self.terminal = "final_trip"
+            self.terminal_from_pit = at_pit
+            end_s += (
+                (0 if at_pit else adj(to_pit_s)) + self.load_s + adj(pit_to_dump_s)
+                + self.unload_s + adj(dump_to_start_s)
+            )
+        elif at_pit and legs["pit_to_start"] is not None:
+            self.terminal = "return_to_base"
+            self.terminal_from_pit = True
+            end_s += return_s
+        else:
+            self.terminal = None
+            self.terminal_from_pit = at_pit
+
+        self.actual_end_s = end_s
+        self.total_trips = cycles + (1 if self.terminal == "final_trip" else 0)
+        self.overtime_minutes = 0
+        if end_s > self.scheduled_end_s:
+            self.overtime_minutes = ((end_s - self.scheduled_end_s) % SECONDS_PER_DAY) // 60
+
+        logger.debug(
+            f"Schedule for {pit_name or 'Pit Site'}: {cycles} cycles, terminal={self.terminal}, "
+            f"end={format_clock(end_s)}, overtime={self.overtime_minutes}m"
+        )
+
+    def adjust(self, seconds):
+        """
+        Apply the adjust_time percentage buffer to a duration.
+        """
+        return seconds + int(seconds * self.adjust_time / 100)
+
+    @property
+    def actual_end_time(self):
+        return format_clock(self.actual_end_s)
+
+    @property
+    def routes(self):
+        """
+        Lazy, indexable view over the trip dicts of this schedule.
+        """
+        return ScheduleRoutes(self)
+
+    def summary(self):
+        """
+        Cheap summary that never materialises any steps.
+        """
+        return {
+            "actual_end_time": self.actual_end_time,
+            "overtime_minutes": self.overtime_minutes,
+            "total_trips": self.total_trips
+        }
+
+    def route_info(self):
+        segments = self.route_segments
+
+        def info(leg):
+            return {
+                "distance_km": leg["distance_km"] if leg else 0,
+                "time_format": leg["time_format"] if leg else "00:00",
+                "route_url": leg["route_url"] if leg else ""
+            }
+
+        return {
+            "start_to_pit": info(segments["start_to_pit"]),
+            "pit_to_dump": info(segments["pit_to_dump"]),
+            "dump_to_pit": info(segments["dump_to_pit"]),
+            "dump_to_start": info(segments["dump_to_start"])
+        }
+
+    def to_compact(self):
+        """
+        JSON-safe inputs the schedule is rebuilt from with from_compact: the
+        leg table and planning parameters, a fraction of the size of to_dict().
+        """
+        return {
+            "route_segments": self.route_segments,
+            "start_time": self.start_time,
+            "work_hours": self.work_hours,
+            "pit_name": self.pit_name,
+            "adjust_time": self.adjust_time
+        }
+
+    @classmethod
+    def from_compact(cls, compact):
+        return cls(**compact)
+
+    def to_dict(self):
+        """
+        Full result in the shape returned by calculate_pit_routes.
+        """
+        return {
+            "routes": list(self.routes),
+            "actual_end_time": self.actual_end_time,
+            "overtime_minutes": self.overtime_minutes,
+            "total_trips": self.total_trips,
+            "route_info": self.route_info()
+        }
+
+    def trip_count(self):
+        return self.cycles + (1 if self.terminal else 0)
+
+    def trip_start_s(self, index):
+        """
+        Start time in seconds of the trip at a zero-based index.
+        """
+        if index == 0:
+            return self.start_s
+        return self.start_s + self.first_cycle_s + (index - 1) * self.cycle_s
+
+    def trip_plan(self, index):
+        """
+        Trip type and (kind, leg name) steps of the trip at a zero-based index.
+        """
+        legs = self.route_segments
+        if index < self.cycles:
+            trip_type = "work_cycle"
+            from_pit = index > 0 or legs["start_to_pit"] is None
+        elif index == self.cycles and self.terminal:
+            trip_type = self.terminal
+            from_pit = self.terminal_from_pit
+        else:
+            raise IndexError("trip index out of range")
+
+        if trip_type == "return_to_base":
+            return trip_type, [(RETURN_TO_BASE, "pit_to_start")]
+        steps = [] if from_pit else [(TRAVEL_TO_PIT, "start_to_pit")]
+        steps += [(LOAD, None), (TRAVEL_TO_DUMP, "pit_to_dump"), (UNLOAD, None)]
+        if trip_type == "work_cycle":
+            steps.append((RETURN_TO_PIT, "dump_to_pit"))
+        else:
+            steps.append((RETURN_TO_BASE, "dump_to_start"))
+        return trip_type, steps
+
+    def step_seconds(self, kind, leg_name):
+        """
+        Adjusted time a step advances the clock by.
+        """
+        if kind == LOAD:
+            return self.load_s
+        if kind == UNLOAD:
+            return self.unload_s
+        return self.adjust(_duration(self.route_segments[leg_name]))
+
+    def step_minutes(self, kind, leg_name):
+        """
+        Unadjusted whole minutes a step is listed with (a leg's duration text).
+        """
+        if kind == LOAD:
+            return LOADING_TIME_MINUTES
+        if kind == UNLOAD:
+            return UNLOADING_TIME_MINUTES
+        return _duration(self.route_segments[leg_name]) // 60
+
+    def trip_steps(self, index):
+        """
+        Trip type and Step records of the trip at a zero-based index.
+        """
+        trip_type, plan = self.trip_plan(index)
+        clock = self.trip_start_s(index)
+        steps = []
+        for kind, leg_name in plan:
+            end_s = clock + self.step_seconds(kind, leg_name)
+            steps.append(Step(kind, leg_name, clock, end_s))
+            clock = end_s
+        return trip_type, steps
+
+    def step_fields(self, kind, leg_name):
+        """
+        Action, time_taken and leg fields of a step's dict, built once per
+        (kind, leg) and shared by every trip.
+        """
+        key = (kind, leg_name)
+        if key not in self._step_fields:
+            pit_label = self.pit_name or "Pit Site"
+            action = {
+                TRAVEL_TO_PIT: f"Travel to {pit_label}",
+                LOAD: f"Load at {pit_label}",
+                TRAVEL_TO_DUMP: "Travel to Dump Site",
+                UNLOAD: "Unload at Dump Site",
+                RETURN_TO_PIT: f"Return to {pit_label}",
+                RETURN_TO_BASE: "Return to Base"
+            }[kind]
+            if leg_name is None:
+                self._step_fields[key] = (action, f"{self.step_minutes(kind, leg_name)} minutes", {})
+            else:
+                leg = self.route_segments[leg_name]
+                self._step_fields[key] = (action, leg["duration"] if leg else "0 mins", {
+                    "distance": leg["distance"] if leg else "0 km",
+                    "distance_km": leg["distance_km"] if leg else 0,
+                    "route_url": leg["route_url"] if leg else "",
+                    "time_format": leg["time_format"] if leg else "00:00"
+                })
+        return self._step_fields[key]
+
+    def build_trip(self, index):
+        """
+        Materialise the trip dict at a zero-based index.
+        """
+        trip_type, trip_steps = self.trip_steps(index)
+        steps = []
+        for step in trip_steps:
+            action, time_taken, leg_fields = self.step_fields(step.kind, step.leg)
+            steps.append({
+                "action": action,
+                "time_taken": time_taken,
+                "arrival_time": format_clock(step.end_s),
+                **leg_fields
+            })
+
+        return {
+            "trip": index + 1,
+            "steps": steps,
+            "type": trip_type
+        }
+
+
+class ScheduleRoutes(Sequence):
+    """
+    Read-only sequence of trip dicts, built on access.
+    """
+
+    def __init__(self, schedule):
+        self._schedule = schedule
+
+    def __len__(self):
+        return self._schedule.trip_count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("trip index out of range")
+        return self._schedule.build_trip(index)
+
+
+def _hours_minutes(minutes):
+    return f"{minutes//60}:{str(minutes%60).zfill(2)}"
+
+
+def schedule_table(schedule, load_size, rate_per_tonne):
+    """
+    Daily schedule table for one pit, built from the schedule's typed steps:
+    the rows from Start of Day to End of Day plus the day's total minutes,
+    revenue and hourly rate. Each row's time is the unadjusted step minutes;
+    the adjust_time buffer only moves the clock and the total.
+    """
+    truck_earning = load_size * rate_per_tonne
+    adjust_time = schedule.adjust_time
+    clock = datetime(1900, 1, 1) + timedelta(seconds=schedule.start_s)
+    total_minutes = 0
+    rows = [["Start of Day", "", clock.strftime("%I:%M:%S %p"), "", "(START --> LOAD)", "", ""]]
+
+    def advance(minutes):
+        nonlocal clock, total_minutes
+        extra = (minutes / 100) * adjust_time if adjust_time > 0 else 0
+        clock += timedelta(minutes=(minutes + extra))
+        total_minutes += (minutes + extra)
+        return clock.strftime("%I:%M:%S %p")
+
+    previous = None
+    for i in range(schedule.trip_count()):
+        trip_type, plan = schedule.trip_plan(i)
+        minutes = {kind: schedule.step_minutes(kind, leg_name) for kind, leg_name in plan}
+
+        if trip_type == "work_cycle":
+            # The load row after the first trip counts this trip's return to the pit
+            load_minutes = minutes.get(TRAVEL_TO_PIT if i == 0 else RETURN_TO_PIT, 0) + minutes[LOAD]
+            rows.append(["Load Site -Clean Pit", _hours_minutes(load_minutes), advance(load_minutes), "Load", "(LOAD --> DUMP)", "", load_size])
+            dump_minutes = minutes[TRAVEL_TO_DUMP] + minutes[UNLOAD]
+            rows.append(["Dump Site", _hours_minutes(dump_minutes), advance(dump_minutes), "Dump", "(DUMP --> LOAD)", truck_earning, ""])
+
+        elif trip_type == "return_to_base":
+            return_minutes = minutes[RETURN_TO_BASE]
+            rows.append(["End of Day", _hours_minutes(return_minutes), advance(return_minutes), "", "(DUMP --< END)", "", ""])
+
+        elif trip_type == "final_trip":
+            if TRAVEL_TO_PIT in minutes:
+                load_minutes = minutes[TRAVEL_TO_PIT]
+            elif previous is not None:
+                load_minutes = previous.get(RETURN_TO_PIT, 0)
+            else:
+                load_minutes = 0
+            load_minutes += minutes[LOAD]
+            if load_minutes > 0:
+                rows.append(["Load Site -Clean Pit", _hours_minutes(load_minutes), advance(load_minutes), "Load", "(LOAD --> DUMP)", "", load_size])
+            dump_minutes = minutes[TRAVEL_TO_DUMP] + minutes[UNLOAD]
+            if dump_minutes > 0:
+                rows.append(["Dump Site", _hours_minutes(dump_minutes), advance(dump_minutes), "Dump", "(DUMP --> END)", truck_earning, ""])
+            return_minutes = minutes[RETURN_TO_BASE]
+            rows.append(["End of Day", _hours_minutes(return_minutes), advance(return_minutes), "", "(DUMP --< END)", "", ""])
+            rows.append(["", "", "", "", "", "", ""])
+
+        previous = minutes
+
+    total_minutes = int(total_minutes)
+    revenue = truck_earning * schedule.total_trips
+    return {
+        "rows": rows,
+        "total_minutes": total_minutes,
+        "revenue": revenue,
+        "hourly_rate": revenue / (total_minutes / 60) if total_minutes > 0 else 0
+    }
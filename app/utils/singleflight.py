@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import weakref
+import threading
+
+from app.utils.locks import striped_lock
+
+logger = logging.getLogger("app.singleflight")
+
+# Every live SingleFlight, for metrics
+_flights = weakref.WeakSet()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one execution.
+
+    `do` serves threads: followers block until the leader's call returns.
+    `do_async` serves asyncio tasks on the same loop: followers await the
+    leader's task. Results and exceptions are shared with every follower.
+
+    With lock_dir set, leaders in different processes also take a per-key
+    file lock; whoever waited on it first checks lookup(key) (normally the
+    shared cache) and returns that instead of calling again. publish() is
+    called before the lock is released so that lookup can see the result.
+    """
+
+    def __init__(self, name, lock_dir=None, lookup=None, publish=None, lock_timeout=30, stripes=256):
+        self.name = name
+        self.lock_dir = lock_dir
+        self.lookup = lookup
+        self.publish = publish
+        self.lock_timeout = lock_timeout
+        self.stripes = stripes
+        self.executed = 0
+        self.coalesced = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        _flights.add(self)
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            logger.debug(f"[{self.name}] Coalesced call for {key}")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, func, *args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def do_async(self, key, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        with self._lock:
+            task = self._tasks.get(flight_key)
+            if task is None:
+                task = loop.create_task(self._lead_async(key, func, *args, **kwargs))
+                self._tasks[flight_key] = task
+                self.executed += 1
+
+                def forget(finished, flight_key=flight_key):
+                    with self._lock:
+                        if self._tasks.get(flight_key) is finished:
+                            del self._tasks[flight_key]
+
+                task.add_done_callback(forget)
+            else:
+                self.coalesced += 1
+                logger.debug(f"[{self.name}] Coalesced task for {key}")
+        # Shield so a cancelled caller does not cancel the shared fetch
+        return await asyncio.shield(task)
+
+    def _shared_result(self, key):
+        if self.lookup is None:
+            return None
+        result = self.lookup(key)
+        if result is not None:
+            with self._lock:
+                self.shared += 1
+            logger.debug(f"[{self.name}] Result for {key} came from another process")
+        return result
+
+    def _lead(self, key, func, *args, **kwargs):
+        if not self.lock_dir:
+            return func(*args, **kwargs)
+        lock = striped_lock(self.lock_dir, self.name, key, self.stripes)
+        acquired = lock.acquire(timeout=self.lock_timeout)
+        try:
+            result = self._shared_result(key)
+            if result is None:
+                result = func(*args, **kwargs)
+                if self.publish is not None:
+                    self.publish()
+            return result
+        finally:
+            if acquired:
+                lock.release()
+
+    async def _lead_async(self, key, func, *args, **kwargs):
+        if not self.lock_dir:
+            return await func(*args, **kwargs)
+        lock = striped_lock(self.lock_dir, self.name, key, self.stripes)
+        acquired = await lock.acquire_async(timeout=self.lock_timeout)
+        try:
+            result = self._shared_result(key)
+            if result is None:
+                result = await func(*args, **kwargs)
+                if self.publish is not None:
+                    await asyncio.to_thread(self.publish)
+            return result
+        finally:
+            if acquired:
+                lock.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "shared": self.shared,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
+
+
+def all_flights():
+    """
+    Return every live SingleFlight in the process.
+    """
+    return list(_flights)
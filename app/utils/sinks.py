@@ -0,0 +1,347 @@
+import os
+import csv
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+
+from app.config import OUTPUT_SINK, OUTPUT_DIR, OUTPUT_XLSX_PATH, OUTPUT_SQLITE_PATH
+from app.utils.cache import sqlite_connection
+from app.utils.locks import ProcessLock
+from app.utils.google_sheets import WorksheetIndex, layout_sections, create_worksheets, write_sheets
+
+logger = logging.getLogger("app.sinks")
+
+# Characters Excel does not allow in worksheet titles, and its title length limit
+_XLSX_INVALID = str.maketrans({c: "_" for c in "[]:*?/\\"})
+_XLSX_MAX_TITLE = 31
+
+
+def grid(sections):
+    """
+    The laid out sections as a list of rows, padded so every row is as wide
+    as the widest one, for outputs without cell addressing.
+    """
+    blocks, _, _ = layout_sections(sections)
+    cells = {}
+    for row, values in blocks:
+        for i, line in enumerate(values):
+            for j, value in enumerate(line):
+                cells[(row + i, j + 1)] = value
+    if not cells:
+        return []
+    height = max(row for row, _ in cells)
+    width = max(col for _, col in cells)
+    return [[cells.get((row, col), "") for col in range(1, width + 1)] for row in range(1, height + 1)]
+
+
+class OutputSink:
+    """
+    Destination for pit worksheets. create_worksheets reserves uniquely
+    named worksheets and returns {"title", "id"} refs; write_sheets fills
+    them from (title, id, sections) targets. Remote sinks are written by
+    the background sheet writer when SHEETS_WRITE_MODE is queue.
+    """
+    name = ""
+    remote = False
+
+    def create_worksheets(self, base_names):
+        raise NotImplementedError
+
+    def write_sheets(self, targets):
+        raise NotImplementedError
+
+
+class GoogleSheetsSink(OutputSink):
+    """
+    The configured Google spreadsheet, through gspread.
+    """
+    name = "sheets"
+    remote = True
+
+    def create_worksheets(self, base_names):
+        return [{"title": sheet.title, "id": sheet.id} for sheet in create_worksheets(base_names)]
+
+    def write_sheets(self, targets):
+        write_sheets(targets)
+
+
+class CSVSink(OutputSink):
+    """
+    One CSV file per worksheet in a directory. Formatting is not kept; the
+    id is the file path.
+    """
+    name = "csv"
+
+    def __init__(self, directory=OUTPUT_DIR):
+        self.directory = directory
+        self.index = WorksheetIndex(self._titles)
+
+    def _titles(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [name[:-len(".csv")] for name in os.listdir(self.directory) if name.endswith(".csv")]
+
+    def _path(self, title):
+        return os.path.join(self.directory, title.replace(os.sep, "_") + ".csv")
+
+    def create_worksheets(self, base_names):
+        os.makedirs(self.directory, exist_ok=True)
+        refs = []
+        for title in self.index.allocate([name.replace(os.sep, "_") for name in base_names]):
+            path = self._path(title)
+            try:
+                open(path, "x").close()
+            except FileExistsError:
+                # Written by another process since the index was loaded
+                self.index.invalidate()
+                raise
+            refs.append({"title": title, "id": path})
+        return refs
+
+    def write_sheets(self, targets):
+        for title, path, sections in targets:
+            with open(path, "w", newline="") as f:
+                csv.writer(f).writerows(grid(sections))
+
+
+class XLSXSink(OutputSink):
+    """
+    Worksheets in one local Excel workbook, with the banner merges and
+    formatting. Needs openpyxl, imported on first use. Every change is made
+    under a lock file and rereads the workbook if another server process
+    saved it since, so workers never overwrite each other's sheets.
+    """
+    name = "xlsx"
+
+    def __init__(self, path=OUTPUT_XLSX_PATH):
+        self.path = path
+        self.index = WorksheetIndex(lambda: self._workbook.sheetnames)
+        self._workbook = None
+        self._stamp = None
+        self._lock = threading.Lock()
+        self._file_lock = ProcessLock(path + ".lock")
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if not self._file_lock.acquire(timeout=60):
+                raise Exception(f"Timed out waiting for the lock on {self.path}")
+            try:
+                yield
+            finally:
+                self._file_lock.release()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        # Called under _locked(); rereads the file if it changed since our last load or save
+        stamp = self._file_stamp()
+        if self._workbook is None or stamp != self._stamp:
+            try:
+                import openpyxl
+            except ImportError:
+                raise Exception("The xlsx output sink needs openpyxl (pip install openpyxl)")
+            if stamp is not None:
+                self._workbook = openpyxl.load_workbook(self.path)
+            else:
+                self._workbook = openpyxl.Workbook()
+                self._workbook.remove(self._workbook.active)
+            self._stamp = stamp
+            self.index.invalidate()
+        return self._workbook
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._workbook.save(self.path)
+        self._stamp = self._file_stamp()
+
+    def create_worksheets(self, base_names):
+        # Leave room for a " (n)" suffix within Excel's title limit
+        names = [name.translate(_XLSX_INVALID)[:_XLSX_MAX_TITLE - 5] for name in base_names]
+        with self._locked():
+            workbook = self._load()
+            titles = self.index.allocate(names)
+            for title in titles:
+                workbook.create_sheet(title)
+            self._save()
+        return [{"title": title, "id": title} for title in titles]
+
+    @staticmethod
+    def _style(cell_format):
+        from openpyxl.styles import Alignment, Font, PatternFill
+
+        def hex_color(color):
+            return "".join(f"{round(color.get(c, 0) * 255):02X}" for c in ("red", "green", "blue"))
+
+        text = cell_format.get("textFormat", {})
+        style = {"font": Font(
+            bold=text.get("bold", False),
+            color=hex_color(text["foregroundColor"]) if "foregroundColor" in text else None
+        )}
+        if "backgroundColor" in cell_format:
+            style["fill"] = PatternFill("solid", fgColor=hex_color(cell_format["backgroundColor"]))
+        if "horizontalAlignment" in cell_format:
+            style["alignment"] = Alignment(
+                horizontal=cell_format["horizontalAlignment"].lower(),
+                vertical={"MIDDLE": "center"}.get(cell_format.get("verticalAlignment"), "bottom")
+            )
+        return style
+
+    def write_sheets(self, targets):
+        with self._locked():
+            workbook = self._load()
+            for title, _, sections in targets:
+                worksheet = workbook[title]
+                blocks, merges, formats = layout_sections(sections)
+                for row, values in blocks:
+                    for i, line in enumerate(values):
+                        for j, value in enumerate(line):
+                            worksheet.cell(row=row + i, column=j + 1, value=value)
+                for row, last_column in merges:
+                    worksheet.merge_cells(start_row=row, start_column=1, end_row=row, end_column=last_column)
+                for row, last_column, cell_format in formats:
+                    style = self._style(cell_format)
+                    for column in range(1, last_column + 1):
+                        cell = worksheet.cell(row=row, column=column)
+                        for attribute, value in style.items():
+                            setattr(cell, attribute, value)
+            self._save()
+
+
+class SQLiteSink(OutputSink):
+    """
+    Worksheets as rows of cells in a local SQLite database. Formatting is
+    not kept; the id is the worksheet's row id.
+    """
+    name = "sqlite"
+
+    def __init__(self, path=OUTPUT_SQLITE_PATH):
+        self.path = path
+        self.index = WorksheetIndex(self._titles)
+        self._ready = False
+
+    def _conn(self):
+        conn = sqlite_connection(self.path)
+        if not self._ready:
+            conn.execute("CREATE TABLE IF NOT EXISTS worksheets (id INTEGER PRIMARY KEY, title TEXT UNIQUE, created_at REAL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS worksheet_cells (worksheet_id INTEGER, row INTEGER, col INTEGER, value, "
+                "PRIMARY KEY (worksheet_id, row, col))"
+            )
+            self._ready = True
+        return conn
+
+    def _titles(self):
+        return [title for (title,) in self._conn().execute("SELECT title FROM worksheets")]
+
+    def create_worksheets(self, base_names):
+        titles = self.index.allocate(base_names)
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            refs = [
+                {"title": title, "id": conn.execute("INSERT INTO worksheets (title, created_at) VALUES (?, ?)", (title, now)).lastrowid}
+                for title in titles
+            ]
+        except BaseException:
+            conn.execute("ROLLBACK")
+            self.index.invalidate()
+            raise
+        conn.execute("COMMIT")
+        return refs
+
+    def write_sheets(self, targets):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for _, worksheet_id, sections in targets:
+                blocks, _, _ = layout_sections(sections)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO worksheet_cells VALUES (?, ?, ?, ?)",
+                    [
+                        (worksheet_id, row + i, j + 1, value)
+                        for row, values in blocks for i, line in enumerate(values) for j, value in enumerate(line)
+                    ]
+                )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+class MemorySink(OutputSink):
+    """
+    In-process fake of the Sheets backend for offline and load tests. It
+    records each call and the cells written, keeping only the most recent
+    calls and worksheets so long runs stay bounded.
+    """
+    name = "memory"
+
+    def __init__(self, max_calls=10000, max_sheets=1000):
+        self.calls = deque(maxlen=max_calls)
+        self.sheets = OrderedDict()
+        self.max_sheets = max_sheets
+        self.index = WorksheetIndex(list)
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def create_worksheets(self, base_names):
+        titles = self.index.allocate(base_names)
+        with self._lock:
+            self.calls.append(("create_worksheets", tuple(titles)))
+            refs = []
+            for title in titles:
+                refs.append({"title": title, "id": self._next_id})
+                self._next_id += 1
+                self.sheets[title] = {"cells": {}, "merges": [], "formats": []}
+                while len(self.sheets) > self.max_sheets:
+                    self.sheets.popitem(last=False)
+            return refs
+
+    def write_sheets(self, targets):
+        with self._lock:
+            self.calls.append(("write_sheets", tuple(title for title, _, _ in targets)))
+            for title, _, sections in targets:
+                sheet = self.sheets.setdefault(title, {"cells": {}, "merges": [], "formats": []})
+                blocks, merges, formats = layout_sections(sections)
+                for row, values in blocks:
+                    for i, line in enumerate(values):
+                        for j, value in enumerate(line):
+                            sheet["cells"][(row + i, j + 1)] = value
+                sheet["merges"].extend(merges)
+                sheet["formats"].extend(formats)
+
+    def clear(self):
+        with self._lock:
+            self.calls.clear()
+            self.sheets.clear()
+        self.index.invalidate()
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+_sink_types = {sink.name: sink for sink in (GoogleSheetsSink, CSVSink, XLSXSink, SQLiteSink, MemorySink)}
+
+
+def get_sink(name=None):
+    """
+    Return the output sink registered under name (default OUTPUT_SINK):
+    "sheets", "csv", "xlsx", "sqlite" or "memory".
+    """
+    name = name or OUTPUT_SINK
+    with _sinks_lock:
+        if name not in _sinks:
+            if name not in _sink_types:
+                raise Exception(f"Unknown output sink: {name}")
+            _sinks[name] = _sink_types[name]()
+        return _sinks[name]
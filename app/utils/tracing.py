@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import queue
+import logging
+import secrets
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.config import TRACE_EXPORTER, TRACE_JSONL_PATH, TRACE_OTLP_ENDPOINT, TRACE_MAX_SPANS
+
+logger = logging.getLogger("app.tracing")
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed operation in a trace. Spans nest through a context variable,
+    so children are recorded against whichever span is active when they start.
+    root_id is the span id of the local root the span is collected under.
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, root_id=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.root_id = root_id or self.span_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.duration = None
+        self.error = None
+        self._start = time.perf_counter()
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class _Trace:
+    def __init__(self, root):
+        self.root = root
+        self.spans = []
+        self.dropped = 0
+
+
+# Traces being collected, keyed by root span id: requests continuing the
+# same incoming trace id each get their own
+_traces = {}
+_traces_lock = threading.Lock()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_trace_id():
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def parse_traceparent(header):
+    """
+    Return the trace id from a W3C traceparent header, or None.
+    """
+    parts = (header or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and parts[1] != "0" * 32:
+        try:
+            int(parts[1], 16)
+            return parts[1].lower()
+        except ValueError:
+            return None
+    return None
+
+
+@contextmanager
+def span(name, trace_id=None, **attributes):
+    """
+    Record a span around the block. Without an active span this starts a
+    new trace (continuing trace_id if given); the trace tree is exported
+    when its root span ends.
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        current = Span(name, parent.trace_id, parent.span_id, attributes, root_id=parent.root_id)
+    else:
+        current = Span(name, trace_id or secrets.token_hex(16), attributes=attributes)
+        with _traces_lock:
+            _traces[current.root_id] = _Trace(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end()
+        _current_span.reset(token)
+        _finish(current)
+
+
+def record_span(name, duration, **attributes):
+    """
+    Record an already-finished operation (e.g. from a response hook) as a
+    child of the active span. Does nothing outside a trace.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return
+    finished = Span(name, parent.trace_id, parent.span_id, attributes, root_id=parent.root_id)
+    finished.start_time -= duration
+    finished.duration = duration
+    _finish(finished)
+
+
+def _finish(finished):
+    with _traces_lock:
+        trace = _traces.get(finished.root_id)
+        if trace is None:
+            # Ended after its root (e.g. a streamed body); export on its own
+            trace = _Trace(finished)
+        elif trace.root is finished:
+            del _traces[finished.root_id]
+        elif len(trace.spans) < TRACE_MAX_SPANS:
+            trace.spans.append(finished)
+            return
+        else:
+            trace.dropped += 1
+            return
+    export(build_tree(trace.root, trace.spans, trace.dropped))
+
+
+def build_tree(root, spans, dropped=0):
+    """
+    Nest finished spans under their parents, children in start order.
+    """
+    nodes = {s.span_id: {**s.to_dict(), "children": []} for s in [root, *spans]}
+    for s in sorted(spans, key=lambda s: s.start_time):
+        parent = nodes.get(s.parent_id, nodes[root.span_id])
+        parent["children"].append(nodes[s.span_id])
+    return {
+        "trace_id": root.trace_id,
+        "span_count": len(spans) + 1,
+        "dropped_spans": dropped,
+        "root": nodes[root.span_id]
+    }
+
+
+class JSONLExporter:
+    """
+    Append each trace tree as one JSON line.
+    """
+
+    def __init__(self, path=TRACE_JSONL_PATH):
+        self.path = path
+
+    def export(self, trace):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(trace, default=str) + "\n")
+
+
+class OTLPExporter:
+    """
+    POST each trace to an OTLP/HTTP collector as OTLP JSON.
+    """
+
+    def __init__(self, endpoint=TRACE_OTLP_ENDPOINT, service_name="route-planning-backend"):
+        self.endpoint = endpoint
+        self.service_name = service_name
+
+    @staticmethod
+    def _attributes(attributes):
+        def value(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+        return [{"key": k, "value": value(v)} for k, v in attributes.items()]
+
+    def _spans(self, trace_id, node):
+        start_ns = int(node["start"] * 1e9)
+        span = {
+            "traceId": trace_id,
+            "spanId": node["span_id"],
+            "name": node["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int((node["duration_ms"] or 0) * 1e6)),
+            "attributes": self._attributes(node["attributes"]),
+            "status": {"code": 2, "message": node["error"]} if node["error"] else {"code": 1}
+        }
+        if node["parent_id"]:
+            span["parentSpanId"] = node["parent_id"]
+        yield span
+        for child in node["children"]:
+            yield from self._spans(trace_id, child)
+
+    def export(self, trace):
+        import requests
+
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": self._attributes({"service.name": self.service_name})},
+            "scopeSpans": [{
+                "scope": {"name": "app.tracing"},
+                "spans": list(self._spans(trace["trace_id"], trace["root"]))
+            }]
+        }]}
+        requests.post(self.endpoint, json=payload, timeout=5).raise_for_status()
+
+
+def _make_exporter(kind):
+    if kind == "jsonl":
+        return JSONLExporter()
+    if kind == "otlp":
+        return OTLPExporter()
+    return None
+
+
+_exporter = _make_exporter(TRACE_EXPORTER)
+_export_queue = queue.Queue(maxsize=1000)
+_export_thread = None
+_export_lock = threading.Lock()
+
+
+def _export_worker():
+    while True:
+        trace = _export_queue.get()
+        try:
+            _exporter.export(trace)
+        except Exception as e:
+            logger.error(f"Could not export trace {trace['trace_id']}: {e}")
+
+
+def export(trace):
+    """
+    Hand a finished trace to the exporter thread; never blocks the caller.
+    """
+    global _export_thread
+    if _exporter is None:
+        return
+    if _export_thread is None:
+        with _export_lock:
+            if _export_thread is None:
+                _export_thread = threading.Thread(target=_export_worker, name="trace-export", daemon=True)
+                _export_thread.start()
+    try:
+        _export_queue.put_nowait(trace)
+    except queue.Full:
+        logger.warning(f"Trace export queue full, dropping trace {trace['trace_id']}")
+
+
+def annotate(**attributes):
+    """
+    Set attributes on the active span, if any.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.set_attributes(**attributes)
+
+
+def traced(name):
+    """
+    Decorator recording a span around each call of a coroutine function.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,4 +1,8 @@
 import uvicorn
 
+from app.config import WEB_CONCURRENCY, LOG_LEVEL
+
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8080, reload=False)
\ No newline at end of file
+    # WEB_CONCURRENCY > 1 runs several worker processes that share caches,
+    # single-flight locks and Google quota through CACHE_DB_PATH / SHARED_LOCK_DIR
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8080, reload=False, workers=WEB_CONCURRENCY, log_level=LOG_LEVEL.lower())
@@ -0,0 +1,65 @@
+"""
+Measure cold-start import time of the FastAPI app in fresh interpreters.
+
+    python scripts/bench_startup.py [--runs 10] [--module app.main] [--importtime]
+
+--importtime also prints the slowest imports reported by `python -X importtime`.
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMER = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def time_import(module):
+    output = subprocess.run(
+        [sys.executable, "-c", TIMER.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(module, limit=15):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  self [us] | cumulative | imported package"
+        self_us, cumulative_us, name = (part.strip() for part in line.split(":", 1)[1].split("|"))
+        rows.append((int(cumulative_us), int(self_us), name))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--importtime", action="store_true")
+    args = parser.parse_args()
+
+    times = [time_import(args.module) for _ in range(args.runs)]
+    print(f"import {args.module}: {args.runs} runs")
+    print(f"  min    {min(times) * 1000:8.1f} ms")
+    print(f"  median {statistics.median(times) * 1000:8.1f} ms")
+    print(f"  max    {max(times) * 1000:8.1f} ms")
+
+    if args.importtime:
+        print("\nslowest imports (cumulative / self, ms):")
+        for cumulative_us, self_us, name in slowest_imports(args.module):
+            print(f"  {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+from array import array
+
+from app.utils.providers import RoadGraph, haversine_m
+
+
+def make_graph(points):
+    n = len(points)
+    return RoadGraph(
+        array("d", [p[0] for p in points]),
+        array("d", [p[1] for p in points]),
+        array("l", [0] * (n + 1)),
+        array("l"),
+        array("d"),
+        array("d"),
+    )
+
+
+def test_nearest_node_looks_across_cell_boundary():
+    # The point sits just below the 0.01 degree cell boundary at 40.01.  Node 0
+    # shares its cell but is ~1 km away; node 1 is ~20 m away in the next cell.
+    point = (40.0099, -105.005)
+    graph = make_graph([(40.0009, -105.005), (40.0101, -105.005)])
+
+    node, distance = graph.nearest_node(point)
+
+    assert node == 1
+    assert distance == haversine_m(point, (40.0101, -105.005))
+
+
+def test_nearest_node_returns_none_without_nearby_nodes():
+    graph = make_graph([(41.0, -105.0)])
+
+    assert graph.nearest_node((40.0, -105.0)) == (None, float("inf"))